@@ -2,11 +2,9 @@
 import torch
 import random
 import numpy as np
-import matplotlib.pyplot as plt
 from collections import deque
 from walk_game import WalkGame
 from model import Linear_QNet, QTrainer
-from IPython import display
 
 ###
 # TODO: don't start training model until HIST_LENGTH turns in
@@ -21,9 +19,6 @@ LR = 0.001  # learning rate
 HIST_LENGTH = 150  # number of prices in history to make decision from
 
 
-plt.ion()
-
-
 class Agent(object):
     def __init__(self):
         self.n_games = 0
@@ -144,6 +139,11 @@ def get_ma(a_list, n):
 
 
 def plot(scores, mean_scores, ma_scores):
+    # imported on the first plot, so importing this module starts no GUI backend
+    import matplotlib.pyplot as plt
+    from IPython import display
+    plt.ion()
+
     display.clear_output(wait=True)
     display.display(plt.gcf())
     plt.clf()
@@ -1,17 +1,14 @@
 
-import torch
-import random
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from collections import deque
 from walk_game import WalkGame
-from model import Linear_QNet, QTrainer
-from IPython import display
-
-###
-# TODO: include option to load the model
-#   https://stackoverflow.com/questions/42703500/best-way-to-save-a-trained-model-in-pytorch
-###
+from model import Linear_QNet, QTrainer, select_actions
+from replay_memory import ReplayMemory, PrioritizedReplayMemory
+from helper import MetricsLogger
+from checkpoint import Checkpointer, load_checkpoint
+from episode_log import EpisodeRecorder
+from profiler import PhaseTimer
+from scheduler import make_schedule
 
 
 MAX_MEMORY = 100000
@@ -20,16 +17,37 @@ LR = 0.001  # learning rate
 
 HIST_LENGTH = 150  # number of prices in history to make decision from
 
-
-plt.ion()
+HEADLESS = False  # train without a window at full CPU speed
+RENDER_EVERY = 0  # when headless, still show every Nth game (0 to never show)
+DRAW_EVERY = 1  # when showing a game, only draw every Nth frame
+PRIORITIZED_REPLAY = False  # sample long memory by TD error instead of uniformly
+METRICS_PATH = 'metrics.jsonl'  # per-game metrics are appended here
+LIVE_PLOT = True  # chart the metrics in a separate process
+CHECKPOINT_PATH = './model/checkpoint.pth'  # full training state, for resuming
+CHECKPOINT_EVERY_STEPS = 50000  # 0 to not checkpoint on env steps (checked as each game ends)
+CHECKPOINT_EVERY_SECONDS = 300  # 0 to not checkpoint on time
+RESUME = False  # carry on from CHECKPOINT_PATH if it exists
+MEMORY_PATH = None  # folder to memory-map the replay memory into, kept across restarts
+EPISODE_LOG = None  # file to record every game into for episode_viewer.py, e.g. 'episodes.bin'
+PROFILE_EVERY = 60  # seconds between time-per-phase summary lines, 0 to turn them off
+PROFILE_PATH = 'profile.json'  # the latest phase timings, rewritten with each summary line
+UPDATE_SCHEDULE = 'per_step'  # per_step (a batch-of-one update every move, as before), every_k, replay_ratio or episode_end
+UPDATE_EVERY = 4  # every_k: env steps between minibatch updates
+UPDATE_BATCH_SIZE = 32  # every_k and replay_ratio: minibatch size (BATCH_SIZE is for once-a-game batches)
+REPLAY_RATIO = 8  # replay_ratio: transitions replayed per new transition
+EPISODE_UPDATES = 1  # episode_end: minibatch updates per game
 
 
 class Agent(object):
-    def __init__(self):
+    def __init__(self, prioritized=False, memory_path=None):
         self.n_games = 0
         self.epsilon = 0  # randomness
         self.gamma = 0.9  # discount rate
-        self.memory = deque(maxlen=MAX_MEMORY)
+        self.prioritized = prioritized
+        if self.prioritized:
+            self.memory = PrioritizedReplayMemory(MAX_MEMORY, HIST_LENGTH + 4, np.float32, path=memory_path)
+        else:
+            self.memory = ReplayMemory(MAX_MEMORY, HIST_LENGTH + 4, np.float32, path=memory_path)
         self.model = Linear_QNet(HIST_LENGTH + 4, 512, 2)
         self.trainer = QTrainer(self.model, LR, self.gamma)
 
@@ -63,42 +81,60 @@ class Agent(object):
         return np.array(state, dtype=float)
 
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.push(state, action, reward, next_state, done)
 
-    def train_long_memory(self):
-        if len(self.memory) > BATCH_SIZE:
-            mini_sample = random.sample(self.memory, BATCH_SIZE)  # list of tuples
+    def train_long_memory(self, batch_size=BATCH_SIZE):
+        if self.prioritized:
+            states, actions, rewards, next_states, dones, weights, idx = self.memory.sample(batch_size)
+            td_errors = self.trainer.train_step(states, actions, rewards, next_states, dones, weights)
+            self.memory.update_priorities(idx, td_errors)
         else:
-            mini_sample = self.memory
-
-        states, actions, rewards, next_states, dones = zip(*mini_sample)
-        self.trainer.train_step(states, actions, rewards, next_states, dones)
+            states, actions, rewards, next_states, dones = self.memory.sample(batch_size)  # batched tensors
+            self.trainer.train_step(states, actions, rewards, next_states, dones)
 
     def train_short_memory(self, state, action, reward, next_state, done):
         self.trainer.train_step(state, action, reward, next_state, done)
 
     def get_action(self, state) -> list:
-        # random moves: tradeoff exploration / exploitation
-        self.epsilon = 80 - self.n_games
         final_move = [0, 0]
-        if random.randint(0, 200) < self.epsilon:
-            move = random.randint(0, 1)  # 0 or 1
-        else:
-            state0 = torch.tensor(state, dtype=torch.float)
-            prediction = self.model(state0)
-            move = torch.argmax(prediction).item()
+        move = self.get_actions(np.expand_dims(state, 0))[0]
         final_move[move] = 1
         return final_move
 
+    def get_actions(self, states) -> np.ndarray:
+        # random moves: tradeoff exploration / exploitation
+        # (same odds as the original random.randint(0, 200) < epsilon)
+        self.epsilon = 80 - self.n_games
+        explore = min(max(self.epsilon, 0), 201) / 201
+        return select_actions(self.model, states, explore)
+
 
 def train():
+    metrics = MetricsLogger(METRICS_PATH, plot=LIVE_PLOT, series=('score', 'mean_score', 'ma_score'))
     plot_scores = []
-    plot_mean_scores = []
-    plot_ma_scores = []
     total_score = 0
     record = 0
-    agent = Agent()
-    game = WalkGame(starting_price=100, volatility=3, length=2000)
+    agent = Agent(prioritized=PRIORITIZED_REPLAY, memory_path=MEMORY_PATH)
+    n_steps = 0
+    checkpointer = Checkpointer(CHECKPOINT_PATH, CHECKPOINT_EVERY_STEPS, CHECKPOINT_EVERY_SECONDS)
+    if RESUME and os.path.exists(CHECKPOINT_PATH):
+        training = load_checkpoint(CHECKPOINT_PATH, agent)
+        plot_scores = training['plot_scores']
+        total_score = training['total_score']
+        record = training['record']
+        n_steps = training.get('n_steps', 0)  # not in checkpoints from before steps were counted
+        checkpointer.resumed(n_steps)
+        print('Resumed at game', agent.n_games, 'Record', record)
+    game = WalkGame(
+        starting_price=100, volatility=3, length=2000, headless=HEADLESS, render_every=RENDER_EVERY,
+        draw_every=DRAW_EVERY
+    )
+    recorder = EpisodeRecorder(EPISODE_LOG, game.length) if EPISODE_LOG else None
+    timer = PhaseTimer(PROFILE_EVERY, PROFILE_PATH)
+    schedule = make_schedule(
+        UPDATE_SCHEDULE, BATCH_SIZE, UPDATE_BATCH_SIZE, UPDATE_EVERY, REPLAY_RATIO, EPISODE_UPDATES
+    )
+    print('Updates:', schedule.describe())
 
     while True:
         done = False
@@ -106,30 +142,58 @@ def train():
 
         # only train once enough data
         if game.iteration < HIST_LENGTH:
-            game.play_step([0, 0])
+            with timer.phase('play_step'):
+                game.play_step([0, 0])
         else:
-            state_old = agent.get_state(game)
-            final_move = agent.get_action(state_old)
+            with timer.phase('get_state'):
+                state_old = agent.get_state(game)
+            with timer.phase('get_action'):
+                final_move = agent.get_action(state_old)
 
             # perform move and get new state
-            reward, done, score = game.play_step(final_move)
-            state_new = agent.get_state(game)
+            with timer.phase('play_step'):
+                reward, done, score = game.play_step(final_move)
+            with timer.phase('get_state'):
+                state_new = agent.get_state(game)
 
             # train short memory
-            agent.train_short_memory(state_old, final_move, reward, state_new, done)
+            if schedule.short_memory:
+                with timer.phase('train_short_memory'):
+                    agent.train_short_memory(state_old, final_move, reward, state_new, done)
+                timer.update()
 
             # remember
-            agent.remember(state_old, final_move, reward, state_new, done)
+            with timer.phase('remember'):
+                agent.remember(state_old, final_move, reward, state_new, done)
+
+            # minibatch updates due on this step
+            n_updates = schedule.step()
+            if n_updates:
+                with timer.phase('train_long_memory'):
+                    for _ in range(n_updates):
+                        agent.train_long_memory(schedule.batch_size)
+                timer.update(n_updates)
+        timer.step()
+        n_steps += 1
 
         if done:
             # train the long memory (experience) and plot result
-            game.reset()
+            if recorder is not None:
+                with timer.phase('record'):
+                    recorder.record(agent.n_games + 1, game, score)
+            with timer.phase('play_step'):
+                game.reset()
             agent.n_games += 1
-            agent.train_long_memory()
+            n_updates = schedule.end_episode()
+            with timer.phase('train_long_memory'):
+                for _ in range(n_updates):
+                    agent.train_long_memory(schedule.batch_size)
+            timer.update(n_updates)
 
             if score > record:
                 record = score
-                agent.model.save()
+                with timer.phase('save'):
+                    checkpointer.save_model(agent.model)
 
             print('Game', agent.n_games, 'Score', score, 'Record', record)
 
@@ -137,9 +201,19 @@ def train():
             total_score += score
             mean_score = total_score / agent.n_games
             ma_score = get_ma(plot_scores, 30)
-            plot_mean_scores.append(mean_score)
-            plot_ma_scores.append(ma_score)
-            plot(plot_scores, plot_mean_scores, plot_ma_scores)
+            with timer.phase('plot'):
+                metrics.log(
+                    game=agent.n_games, score=score, mean_score=mean_score, ma_score=ma_score, record=record,
+                    updates_per_sec=schedule.updates_per_sec(), replay_ratio=schedule.replay_ratio()
+                )
+
+            if checkpointer.due(n_steps):
+                with timer.phase('checkpoint'):
+                    agent.memory.flush()
+                    # only the last 30 scores are needed for the moving average
+                    checkpointer.save(agent, n_steps, plot_scores=plot_scores[-30:], total_score=total_score, record=record)
+            timer.end_episode()
+        timer.tick()
 
 
 def get_ma(a_list, n):
@@ -147,23 +221,5 @@ def get_ma(a_list, n):
     return sum(calc_list)/len(calc_list)
 
 
-def plot(scores, mean_scores, ma_scores):
-    display.clear_output(wait=True)
-    display.display(plt.gcf())
-    plt.clf()
-    plt.title('Training...')
-    plt.xlabel('Number of Games')
-    plt.ylabel('Final Value')
-    plt.plot(scores, linestyle='-', color='blue')
-    plt.plot(mean_scores, linestyle='-', color='red')
-    plt.plot(ma_scores, linestyle='--', color='green')
-    plt.ylim(ymin=0)
-    plt.text(len(scores)-1, scores[-1], str(round(scores[-1])))
-    plt.text(len(mean_scores)-1, mean_scores[-1], str(round(mean_scores[-1])))
-    plt.text(len(ma_scores)-1, ma_scores[-1], str(round(ma_scores[-1])))
-    plt.show(block=False)
-    plt.pause(.1)
-
-
 if __name__ == '__main__':
     train()
@@ -0,0 +1,199 @@
+"""
+Seeded benchmarks for the walk game, agent and trainer
+
+Run from this folder:
+    python benchmark.py                      # everything, printed as a table
+    python benchmark.py --json bench.json    # also write machine-readable results
+    python benchmark.py --only train_step    # benchmarks whose name contains a string
+
+Rendering is measured on SDL's dummy video driver with the SPEED clock cap
+removed, so it times the drawing work rather than the frame limiter.
+"""
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+import torch
+
+import walk_game
+from walk_game import WalkGame
+from agent import Agent, MAX_MEMORY, HIST_LENGTH
+from model import Linear_QNet, QTrainer
+from replay_memory import ReplayMemory
+
+MOVES = ([0, 0], [1, 0], [0, 1])
+IMPORT_MODULES = ('walk_game', 'helper', 'episode_log')  # modules worker processes import without needing torch
+IMPORT_BUDGET_MS = 1000  # per module in a fresh interpreter, mostly numpy and pygame themselves
+
+# run in a fresh interpreter: time the import, then check it started no display, fonts or plotting
+IMPORT_CHECK = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+import pygame
+assert not pygame.display.get_init() and not pygame.font.get_init(), 'importing {module} initialised pygame'
+assert 'matplotlib' not in sys.modules, 'importing {module} imported matplotlib'
+print(elapsed)
+'''
+STATE_SIZE = HIST_LENGTH + 4
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def new_game(render) -> WalkGame:
+    walk_game.SPEED = 0  # no frame cap
+    return WalkGame(starting_price=100, volatility=3, length=2000, headless=not render)
+
+
+def bench_play_step(steps, render) -> float:
+    game = new_game(render)
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, done, _ = game.play_step(random.choice(MOVES))
+        if done:
+            game.reset()
+    return steps / (time.perf_counter() - start)
+
+
+def bench_get_state(steps) -> float:
+    agent = Agent()
+    game = new_game(render=False)
+    total = 0
+    for _ in range(steps):
+        start = time.perf_counter()
+        agent.get_state(game)
+        total += time.perf_counter() - start
+        _, done, _ = game.play_step(random.choice(MOVES))
+        if done:
+            game.reset()
+    return 1e6 * total / steps
+
+
+def random_state() -> np.ndarray:
+    return np.random.uniform(0, 500, STATE_SIZE)
+
+
+def bench_train_step(batch_size, repeats) -> float:
+    trainer = QTrainer(Linear_QNet(STATE_SIZE, 512, 2), lr=0.001, gamma=0.9)
+    memory = ReplayMemory(batch_size, STATE_SIZE, np.float32)
+    for _ in range(batch_size):
+        memory.push(random_state(), random.randint(0, 1), random.uniform(-10, 10), random_state(), random.random() < 0.01)
+    batch = memory.sample(batch_size)
+    trainer.train_step(*batch)  # warm up
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        trainer.train_step(*batch)
+        times.append(time.perf_counter() - start)
+    return 1e3 * float(np.median(times))
+
+
+def bench_memory_bytes(n_transitions, legacy) -> float:
+    if not legacy:
+        return ReplayMemory(n_transitions, STATE_SIZE, np.float32).nbytes / n_transitions
+
+    # the original deque of (state, one-hot move, reward, next_state, done) tuples
+    tracemalloc.start()
+    memory = deque(maxlen=MAX_MEMORY)
+    for _ in range(n_transitions):
+        move = [0, 0]
+        move[random.randint(0, 1)] = 1
+        memory.append((random_state(), move, random.uniform(-10, 10), random_state(), random.random() < 0.01))
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used / n_transitions
+
+
+def bench_import(module) -> float:
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT_CHECK.format(module=module)], capture_output=True, text=True
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return 1e3 * float(result.stdout)
+
+
+def benchmarks(steps, repeats) -> list:
+    # (name, unit, params, function)
+    return [
+        *[
+            ('import', 'ms', {'module': module, 'budget_ms': IMPORT_BUDGET_MS}, lambda module=module: bench_import(module))
+            for module in IMPORT_MODULES
+        ],
+        ('play_step', 'steps/sec', {'render': False}, lambda: bench_play_step(steps, render=False)),
+        ('play_step', 'steps/sec', {'render': True}, lambda: bench_play_step(steps // 10, render=True)),
+        ('get_state', 'us/call', {}, lambda: bench_get_state(steps)),
+        *[
+            ('train_step', 'ms', {'batch_size': n}, lambda n=n: bench_train_step(n, repeats))
+            for n in (1, 64, 1000)
+        ],
+        *[
+            ('replay_memory', 'bytes/transition', {'n': n, 'legacy': legacy},
+             lambda n=n, legacy=legacy: bench_memory_bytes(n, legacy))
+            for n in (10000, 100000)
+            for legacy in (True, False)
+        ],
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the walk game, agent and trainer')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--steps', type=int, default=20000, help='env steps per throughput benchmark')
+    parser.add_argument('--repeats', type=int, default=50, help='timed calls per latency benchmark')
+    parser.add_argument('--only', default='', help='run benchmarks whose name contains this')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    over_budget = []
+    for name, unit, params, func in benchmarks(args.steps, args.repeats):
+        if args.only not in name:
+            continue
+        seed_everything(args.seed)
+        value = func()
+        results.append({'name': name, 'params': params, 'value': round(value, 3), 'unit': unit})
+        print(f"{name:<16}{json.dumps(params):<48}{value:>14.3f} {unit}")
+        if 'budget_ms' in params and value > params['budget_ms']:
+            over_budget.append(f"{name} {json.dumps(params)}")
+
+    if args.json:
+        report = {
+            'project': 'random-walk-deep-q',
+            'seed': args.seed,
+            'steps': args.steps,
+            'repeats': args.repeats,
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if over_budget:
+        sys.exit('Over budget: ' + ', '.join(over_budget))
+
+
+if __name__ == '__main__':
+    main()
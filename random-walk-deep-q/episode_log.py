@@ -0,0 +1,77 @@
+"""
+Compact binary logs of whole walk game episodes
+
+A log is a short header (the episode length) followed by one record per game:
+the game number, a reference to its price path (the seed of the game's price
+generator, the start price and the volatility), whether it was the game's first
+episode (which starts before any reset), the final value, and then one byte per
+action (0 hold, 1 buy, 2 sell). That is all it takes to replay a game exactly
+(see episode_viewer.py), at about two kilobytes for a full length game.
+"""
+
+import os
+import struct
+from collections import namedtuple
+
+MAGIC = b'WLKE'
+VERSION = 1
+HEADER = struct.Struct('<4sBI')  # magic, version, episode length
+RECORD = struct.Struct('<IQ?dddI')  # game, seed, first episode, start price, volatility, score, number of actions
+
+Episode = namedtuple('Episode', 'game, seed, first, starting_price, volatility, score, actions')
+
+
+class EpisodeRecorder(object):
+    """
+    Appends finished games to a log, creating it if it does not exist yet
+    """
+    def __init__(self, path, length):
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                logged_length = read_header(f)
+            if logged_length != length:
+                raise ValueError(f'{path} holds games of length {logged_length}, not {length}')
+            self._file = open(path, 'ab')
+        else:
+            self._file = open(path, 'wb')
+            self._file.write(HEADER.pack(MAGIC, VERSION, length))
+
+    def record(self, number, game, score):
+        # call before game.reset(), which starts a new price path and list of actions
+        self._file.write(RECORD.pack(
+            number, game.seed, game.episode == 0, game.price_history[0], game.volatility, score, len(game.actions)
+        ))
+        self._file.write(game.actions)
+        self._file.flush()  # once a game, so a killed run keeps every finished game
+
+    def close(self):
+        self._file.close()
+
+
+def read_header(f) -> int:
+    magic, version, length = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'not a version {VERSION} walk game episode log')
+    return length
+
+
+def read_log(path) -> (int, list):
+    """
+    The episode length and every complete game in a log
+    """
+    with open(path, 'rb') as f:
+        length = read_header(f)
+        data = f.read()
+
+    episodes = []
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        *fields, n_actions = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        actions = data[offset:offset + n_actions]
+        if len(actions) < n_actions:
+            break  # cut off mid-write
+        offset += n_actions
+        episodes.append(Episode(*fields, actions))
+    return length, episodes
@@ -0,0 +1,73 @@
+"""
+Replay games from an episode log
+
+Run from this folder:
+    python episode_viewer.py episodes.bin                  # list the logged games
+    python episode_viewer.py episodes.bin --best           # watch the highest valued game
+    python episode_viewer.py episodes.bin --game 120 --speed 500
+    python episode_viewer.py episodes.bin --check          # replay every game headless
+
+A game is replayed by regenerating its price path from the logged seed, start
+price and volatility and feeding it the logged actions, so it plays out exactly
+as it did in training.
+"""
+
+import argparse
+import walk_game
+from walk_game import WalkGame
+from episode_log import read_log
+
+MOVES = ([0, 0], [1, 0], [0, 1])
+
+
+def replay(episode, length, headless=False) -> float:
+    game = WalkGame(episode.starting_price, episode.volatility, length, headless=headless, seed=episode.seed)
+    if not episode.first:
+        game.reset(seed=episode.seed, starting_price=episode.starting_price, volatility=episode.volatility)
+    score = 0
+    for action in episode.actions:
+        _, done, score = game.play_step(MOVES[action])
+        if done:
+            break
+    return score
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay logged walk games')
+    parser.add_argument('path', help='episode log written during training')
+    parser.add_argument('--game', type=int, help='game number to replay')
+    parser.add_argument('--best', action='store_true', help='replay the highest valued game')
+    parser.add_argument('--speed', type=int, default=walk_game.SPEED, help='frames per second, 0 for no limit')
+    parser.add_argument('--check', action='store_true', help='replay every game headless and compare values')
+    args = parser.parse_args(argv)
+
+    length, episodes = read_log(args.path)
+    if args.check:
+        mismatches = 0
+        for episode in episodes:
+            score = replay(episode, length, headless=True)
+            if score != episode.score:
+                mismatches += 1
+                print('Game', episode.game, 'logged value', episode.score, 'replayed value', score)
+        print('Replayed', len(episodes), 'games,', mismatches, 'mismatches')
+        return
+
+    if args.best:
+        chosen = [max(episodes, key=lambda episode: episode.score)]
+    elif args.game is not None:
+        chosen = [episode for episode in episodes if episode.game == args.game]
+    else:
+        for episode in episodes:
+            print('Game', episode.game, 'Value', round(episode.score, 2), 'Steps', len(episode.actions))
+        return
+    if not chosen:
+        parser.error('no such game in the log')
+
+    walk_game.SPEED = args.speed
+    for episode in chosen:
+        score = replay(episode, length)
+        print('Game', episode.game, 'Value', round(score, 2), '(logged', str(round(episode.score, 2)) + ')')
+
+
+if __name__ == '__main__':
+    main()
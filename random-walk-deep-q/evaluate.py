@@ -0,0 +1,109 @@
+"""
+Seeded greedy evaluation of a trained walk game policy
+
+Run from this folder:
+    python evaluate.py                                  # ./model/model.pth, 200 episodes
+    python evaluate.py --model ./model/new.pth --episodes 1000 --workers 8
+    python evaluate.py --min-mean 500                   # exit non-zero below a mean final value of 500
+
+Episode i is played from seed --seed + i with no exploration and no display,
+so the same model always gets the same final values and two models are
+compared on the same price paths. As in training, the first HIST_LENGTH steps
+only hold while the price history fills up. Episodes are shared out across a
+process pool.
+"""
+
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import random
+import sys
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from walk_game import WalkGame
+from agent import Agent, HIST_LENGTH
+from model import select_actions, load_policy
+
+PERCENTILES = (5, 25, 75, 95)
+
+_policy = None  # the worker's copy of the model, see load_worker
+_agent = None  # only for get_state
+
+
+def load_worker(path):
+    global _policy, _agent
+    torch.set_num_threads(1)  # one core per worker
+    _policy = load_policy(path)
+    _agent = Agent()
+
+
+def play_episode(seed) -> (float, int):
+    game = WalkGame(starting_price=100, volatility=3, length=2000, headless=True)
+    random.seed(seed)  # the start price and volatility
+    game.reset(seed=seed)
+    steps = 0
+    while True:
+        final_move = [0, 0]
+        if game.iteration >= HIST_LENGTH:
+            move = select_actions(_policy, np.expand_dims(_agent.get_state(game), 0), 0)[0]
+            final_move[move] = 1
+        _, done, score = game.play_step(final_move)
+        steps += 1
+        if done:
+            return score, steps
+
+
+def evaluate(path, episodes, workers, seed=0) -> dict:
+    seeds = range(seed, seed + episodes)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn'), initializer=load_worker,
+                             initargs=(path,)) as pool:
+        results = list(pool.map(play_episode, seeds, chunksize=max(1, episodes // (4 * workers))))
+    elapsed = time.perf_counter() - start
+
+    scores = np.array([score for score, _ in results])
+    steps = np.array([n for _, n in results])
+    return {
+        'model': path,
+        'episodes': episodes,
+        'seed': seed,
+        'mean': float(scores.mean()),
+        'std': float(scores.std()),
+        'median': float(np.median(scores)),
+        **{f'p{q}': float(np.percentile(scores, q)) for q in PERCENTILES},
+        'min': float(scores.min()),
+        'max': float(scores.max()),
+        'mean_steps': float(steps.mean()),
+        'seconds': elapsed,
+        'episodes_per_sec': episodes / elapsed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seeded greedy evaluation of a trained walk game policy')
+    parser.add_argument('--model', default='./model/model.pth', help='state dict saved by Linear_QNet.save')
+    parser.add_argument('--episodes', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0, help='episode i is played from seed + i')
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--min-mean', type=float, help='exit non-zero if the mean final value is below this')
+    args = parser.parse_args(argv)
+
+    report = evaluate(args.model, args.episodes, args.workers, args.seed)
+    for name, value in report.items():
+        print(f"{name:<18}{value}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.min_mean is not None and report['mean'] < args.min_mean:
+        sys.exit(f"Mean final value {report['mean']:.2f} is below {args.min_mean}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Per-game metrics without holding up training
+
+MetricsLogger.log() only puts the metrics on a queue. A separate process appends
+them to a JSON-lines file and, if asked, redraws a live chart at most once every
+`refresh` seconds, downsampled to `max_points` points per line.
+"""
+
+import json
+import math
+import queue
+import time
+import multiprocessing as mp
+
+
+class MetricsLogger(object):
+    def __init__(self, path='metrics.jsonl', plot=True, series=('score', 'mean_score', 'ma_score'),
+                 max_points=500, refresh=1.0):
+        self.queue = mp.Queue(maxsize=10000)
+        self.process = mp.Process(
+            target=consume_metrics,
+            args=(self.queue, path, plot, series, max_points, refresh),
+            daemon=True
+        )
+        self.process.start()
+
+    def log(self, **metrics):
+        try:
+            self.queue.put_nowait(metrics)
+        except queue.Full:
+            pass  # the consumer is behind, so drop rather than block training
+
+    def close(self, timeout=5):
+        self.queue.put(None)
+        self.process.join(timeout)
+
+
+def consume_metrics(metrics_queue, path, plot, series, max_points, refresh):
+    history = {name: [] for name in series}
+    if plot:
+        import matplotlib.pyplot as plt
+        plt.ion()
+
+    with open(path, 'a') as f:
+        running = True
+        changed = False
+        last_draw = 0
+        while running:
+            # take everything queued up, waiting at most `refresh` for the first one
+            batch = []
+            try:
+                batch.append(metrics_queue.get(timeout=refresh))
+                while True:
+                    batch.append(metrics_queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            for metrics in batch:
+                if metrics is None:
+                    running = False
+                    break
+                f.write(json.dumps(metrics) + '\n')
+                for name in series:
+                    history[name].append(metrics.get(name))
+                changed = True
+            f.flush()
+
+            if plot and changed and time.monotonic() - last_draw > refresh:
+                draw(plt, history, max_points)
+                plt.pause(.001)
+                changed = False
+                last_draw = time.monotonic()
+
+
+def draw(plt, history, max_points):
+    plt.clf()
+    plt.title('Training...')
+    plt.xlabel('Number of Games')
+    plt.ylabel('Final Value')
+    for name, values in history.items():
+        step = max(1, math.ceil(len(values) / max_points))
+        plt.plot(range(0, len(values), step), values[::step], label=name)
+        plt.text(len(values) - 1, values[-1], str(round(values[-1], 2)))
+    plt.ylim(ymin=0)
+    plt.legend(loc='upper left')
+    plt.show(block=False)
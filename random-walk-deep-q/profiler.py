@@ -0,0 +1,164 @@
+"""
+Per-phase timing of the training loop, cheap enough to leave on
+
+    timer = PhaseTimer()
+    with timer.phase('play_step'):
+        game.play_step(move)
+    timer.step()          # once per env step
+    timer.update()        # once per optimiser update
+    timer.end_episode()   # once per game
+    timer.tick()          # once per loop, prints/dumps when due
+
+Each phase costs two perf_counter calls and a dict update. Every
+`report_every` seconds a summary line is printed (steps/sec, updates/sec and
+where the time went since the last one) and the cumulative and last-episode
+totals are written to a JSON file.
+
+Sending the process SIGUSR1 profiles the next `window` seconds with cProfile,
+writes the stats to profile-<pid>-<time>.prof (for snakeviz or pstats) and
+prints the top functions. For a sampling profile without stopping training,
+attach py-spy to the pid printed at start instead.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import signal
+import time
+from collections import defaultdict
+
+
+class _Phase(object):
+    __slots__ = ('totals', 'name', 'start')
+
+    def __init__(self, totals, name):
+        self.totals = totals
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.totals[self.name] += time.perf_counter() - self.start
+
+
+class PhaseTimer(object):
+    def __init__(self, report_every=60, path='profile.json', window=30):
+        self.report_every = report_every  # seconds between summary lines, 0 to not print or dump
+        self.path = path
+        self.window = window  # seconds profiled after SIGUSR1
+
+        self.totals = defaultdict(float)  # phase -> seconds, since start
+        self.episode = defaultdict(float)  # phase -> seconds, this episode
+        self.last_episode = {}
+        self._phases = {}
+        self.steps = 0
+        self.updates = 0
+        self.episodes = 0
+        self.started = time.perf_counter()
+
+        self._last_report = self.started
+        self._last_totals = {}
+        self._last_steps = 0
+        self._last_updates = 0
+
+        self._profile_requested = False
+        self._profiler = None
+        self._profile_started = 0
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self._request_profile)
+            print('Profiling: kill -USR1', os.getpid(), 'for a', window, 's cProfile window, or py-spy --pid', os.getpid())
+
+    def phase(self, name) -> _Phase:
+        if name not in self._phases:
+            self._phases[name] = _Phase(self.episode, name)
+        return self._phases[name]
+
+    def step(self):
+        self.steps += 1
+
+    def update(self, n=1):
+        self.updates += n
+
+    def end_episode(self):
+        for name, seconds in self.episode.items():
+            self.totals[name] += seconds
+        self.last_episode = dict(self.episode)
+        self.episode.clear()
+        self.episodes += 1
+
+    def tick(self):
+        now = time.perf_counter()
+        if self._profile_requested or self._profiler is not None:
+            self._run_profile_window(now)
+        if self.report_every and now - self._last_report >= self.report_every:
+            self.report(now)
+
+    def summary(self) -> dict:
+        totals = dict(self.totals)
+        for name, seconds in self.episode.items():
+            totals[name] = totals.get(name, 0) + seconds
+        elapsed = time.perf_counter() - self.started
+        return {
+            'seconds': elapsed,
+            'steps': self.steps,
+            'updates': self.updates,
+            'episodes': self.episodes,
+            'steps_per_sec': self.steps / elapsed,
+            'updates_per_sec': self.updates / elapsed,
+            'phases': totals,
+            'last_episode': self.last_episode,
+        }
+
+    def report(self, now=None):
+        now = now or time.perf_counter()
+        summary = self.summary()
+        elapsed = now - self._last_report
+
+        # where the time went since the last line
+        phases = {
+            name: seconds - self._last_totals.get(name, 0)
+            for name, seconds in summary['phases'].items()
+        }
+        print(
+            'Steps/sec', round((self.steps - self._last_steps) / elapsed),
+            'Updates/sec', round((self.updates - self._last_updates) / elapsed, 1),
+            ' '.join(
+                f"{name} {100 * seconds / elapsed:.0f}%"
+                for name, seconds in sorted(phases.items(), key=lambda item: -item[1])
+            )
+        )
+        self._last_report = now
+        self._last_totals = summary['phases']
+        self._last_steps = self.steps
+        self._last_updates = self.updates
+
+        if self.path:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(summary, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def _request_profile(self, signum, frame):
+        # only flag it: the profiler is started from the training loop, not the handler
+        self._profile_requested = True
+
+    def _run_profile_window(self, now):
+        if self._profiler is None:
+            self._profile_requested = False
+            self._profiler = cProfile.Profile()
+            self._profile_started = now
+            self._profiler.enable()
+            print('Profiling for', self.window, 's')
+        elif now - self._profile_started >= self.window:
+            self._profiler.disable()
+            file_name = f'profile-{os.getpid()}-{time.strftime("%Y%m%d-%H%M%S")}.prof'
+            self._profiler.dump_stats(file_name)
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(15)
+            print(out.getvalue())
+            print('Saved', file_name)
+            self._profiler = None
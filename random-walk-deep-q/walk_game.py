@@ -3,6 +3,7 @@ import pygame
 import random
 import numpy as np
 from enum import Enum
+from collections import namedtuple
 from frame_calcs import FrameCalculator
 
 
@@ -14,6 +15,7 @@ from frame_calcs import FrameCalculator
 SPEED = 150  # for robots
 
 TIMEOUT = 300
+HISTORY_CHUNK = 64  # prices per link of a WalkState history
 
 FRAME_X = 800
 FRAME_Y = 480
@@ -28,6 +30,22 @@ BLUE = (000, 000, 255)
 BLACK = (000, 000, 000)
 
 
+# everything play_step depends on, in immutable pieces so copying one is free;
+# history is the price history as a cons list of chunks, ((newest prices), (older
+# chunk, ... None)), so a step copies at most HISTORY_CHUNK prices rather than the
+# whole history, and states still compare and pickle without deep recursion.
+# The price walk does not depend on the actions, so a snapshot draws the rest of
+# the episode's random numbers up front into draws (shared by every state stepped
+# from it) and n_drawn counts how many are used; rng_state is the generator as it
+# was before them. n_actions is the length of the action log at the snapshot.
+# See WalkGame.snapshot/restore and step
+WalkState = namedtuple('WalkState', [
+    'length', 'volatility', 'starting_balance', 'iteration', 'current_price', 'history', 'n_prices',
+    'balance', 'asset_volume', 'last_transaction_price', 'last_transaction', 'rng_state', 'draws', 'n_drawn',
+    'n_actions',
+])
+
+
 class Keypress(Enum):
     NONE = 0  # using it otherwise keypress doesn't change
     UP = 1  # buy
@@ -37,15 +55,15 @@ class Keypress(Enum):
 ###
 # PyGame stuff
 ###
-pygame.init()
-font = pygame.font.SysFont('comicsans', 24, True)
+font = None  # loaded along with the first display, so a headless import starts no part of pygame
 
 
 class WalkGame(object):
     """
     A random walk to emulate buying and selling of assets
     """
-    def __init__(self, starting_price, volatility, length):
+    def __init__(self, starting_price, volatility, length, headless=False, render_every=0, draw_every=1,
+                 seed=None):
         # price line properties
         self.starting_price = starting_price
         self.current_price = starting_price
@@ -55,10 +73,24 @@ class WalkGame(object):
         self.last_transaction_price = -1
         self.last_transaction = 0
 
+        # each episode walks the price with its own generator, so the seed, start
+        # price and volatility reference the whole path; with the actions taken
+        # (one byte each, see episode_log.py) that replays an episode exactly
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.actions = bytearray()
+
         # set display
-        self.display = pygame.display.set_mode((FRAME_X, FRAME_Y))
-        self.clock = pygame.time.Clock()
-        pygame.display.set_caption('Random Walk')
+        # headless skips the display, event polling, font rendering and clock entirely;
+        # with render_every > 0 a headless game still shows every Nth episode
+        self.headless = headless
+        self.render_every = render_every
+        self.draw_every = draw_every  # when rendering, only draw (and tick the clock) every Nth frame
+        self.episode = 0
+        self.display = None
+        self.clock = None
+        if self.rendering:
+            self._init_display()
 
         self.frame_info = FrameCalculator(
             frame_x=FRAME_X,
@@ -68,6 +100,11 @@ class WalkGame(object):
             box1_y=BOX1_Y
         )
 
+        # the first draw after a reset is a full one, later draws only update what changed
+        self._redraw_all = True
+        self._background = None
+        self._drawn_prices = 0  # how much of price_history the box3 line covers
+
         # game properties
         self.keypress = Keypress.NONE
         self.iteration = 0
@@ -78,7 +115,26 @@ class WalkGame(object):
 
         self.reward = 0
 
-    def reset(self):
+    def _init_display(self):
+        global font
+        pygame.init()
+        if font is None:
+            font = pygame.font.SysFont('comicsans', 24, True)
+        self.display = pygame.display.set_mode((FRAME_X, FRAME_Y))
+        self.clock = pygame.time.Clock()
+        pygame.display.set_caption('Random Walk')
+
+    @property
+    def rendering(self) -> bool:
+        if not self.headless:
+            return True
+        return self.render_every > 0 and self.episode % self.render_every == 0
+
+    def reset(self, seed=None, starting_price=None, volatility=None):
+        self.episode += 1
+        if self.rendering and self.display is None:
+            self._init_display()
+
         self.keypress = Keypress.NONE
         self.iteration = 0
         self.balance = self.starting_balance
@@ -86,11 +142,15 @@ class WalkGame(object):
         self.game_over = False
         self.reward = 0
 
-        self.starting_price = random.randint(100, 200)
-        self.volatility = random.uniform(1, 10)
+        self.starting_price = random.randint(100, 200) if starting_price is None else starting_price
+        self.volatility = random.uniform(1, 10) if volatility is None else volatility
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.rng.seed(self.seed)
+        self.actions = bytearray()
         self.current_price = self.starting_price
         self.price_history = [self.starting_price]
         self.last_transaction = 100  # HIST_LENGTH
+        self._redraw_all = True
 
     @property
     def total_value(self) -> float:
@@ -104,19 +164,68 @@ class WalkGame(object):
     def sell_price(self) -> float:
         return self.current_price / 1.01
 
+    def snapshot(self) -> WalkState:
+        """
+        The game state as a WalkState, for step or a later restore
+        """
+        history = None
+        for i in range(0, len(self.price_history), HISTORY_CHUNK):
+            history = (tuple(self.price_history[i:i + HISTORY_CHUNK]), history)
+
+        # at most one price update per step left, from a copy of the generator
+        rng_state = self.rng.getstate()
+        rng = random.Random()
+        rng.setstate(rng_state)
+        draws = tuple(rng.random() for _ in range(max(self.length - self.iteration, 0)))
+
+        return WalkState(
+            self.length, self.volatility, self.starting_balance, self.iteration, self.current_price,
+            history, len(self.price_history), self.balance, self.asset_volume, self.last_transaction_price,
+            self.last_transaction, rng_state, draws, 0, len(self.actions)
+        )
+
+    def restore(self, state):
+        """
+        Put the game back in a WalkState, cutting the action log back to its length
+        at the snapshot so a recorded episode still replays from its seed
+
+        The moves step took to reach a state are not in the log, so don't record
+        an episode restored from a state made by step.
+        """
+        self.length = state.length
+        self.volatility = state.volatility
+        self.starting_balance = state.starting_balance
+        self.iteration = state.iteration
+        self.current_price = state.current_price
+        self.price_history = history_list(state.history)
+        self.balance = state.balance
+        self.asset_volume = state.asset_volume
+        self.last_transaction_price = state.last_transaction_price
+        self.last_transaction = state.last_transaction
+        self.rng.setstate(state.rng_state)
+        for _ in range(state.n_drawn):
+            self.rng.random()
+        del self.actions[state.n_actions:]  # the moves of the discarded branch
+        self.keypress = Keypress.NONE
+        self.game_over = False
+        self.reward = 0
+        self._redraw_all = True
+
     def play_step(self, action) -> (int, bool, float):
         self.iteration += 1
 
         # 1. collect user input
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                quit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP:
-                    self.keypress = Keypress.UP
-                elif event.key == pygame.K_DOWN:
-                    self.keypress = Keypress.DOWN
+        drawing = self.rendering and self.iteration % self.draw_every == 0
+        if drawing:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    quit()
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_UP:
+                        self.keypress = Keypress.UP
+                    elif event.key == pygame.K_DOWN:
+                        self.keypress = Keypress.DOWN
 
         # 2. update balances
         self._user_action(action)
@@ -137,8 +246,9 @@ class WalkGame(object):
         self.reward = self.total_value - self.starting_balance
 
         # 5. update ui and clock
-        self._update_ui()
-        self.clock.tick(SPEED)
+        if drawing:
+            self._update_ui()
+            self.clock.tick(SPEED)
 
         # 6. return game over and value
         return self.reward, self.game_over, self.total_value
@@ -146,7 +256,7 @@ class WalkGame(object):
     def _update_price(self):
         self.price_history.append(self.current_price)
         self.current_price = max(
-            self.current_price + random.uniform(-self.volatility, self.volatility),
+            self.current_price + self.rng.uniform(-self.volatility, self.volatility),
             0
         )
 
@@ -162,6 +272,7 @@ class WalkGame(object):
             new_action = Keypress.NONE
 
         self.keypress = new_action
+        self.actions.append(new_action.value)
 
         # now do the thing
         if self.keypress == Keypress.UP:
@@ -185,22 +296,50 @@ class WalkGame(object):
             self.last_transaction = self.iteration
 
     def _update_ui(self):
-        # set up display
-        self.display.fill(WHITE)
-        pygame.draw.rect(self.display, RED, pygame.Rect(*self.frame_info.box1), 2)
-        pygame.draw.rect(self.display, RED, pygame.Rect(*self.frame_info.box2), 2)
-        pygame.draw.rect(self.display, RED, pygame.Rect(*self.frame_info.box3), 2)
-
-        # box3 graph
-        if len(self.price_history) > 1:
-            pygame.draw.lines(
-                surface=self.display,
-                color=BLUE,
-                closed=False,
-                points=[self._point_map(i, p) for i, p in enumerate(self.price_history, start=10)]  # [(0, p_1), ..., (n, p_n)]
-            )
-
-        # box1 text
+        if self._redraw_all:
+            # set up the background (boxes and graph) that the text is drawn over
+            self._background = self.display.copy()
+            self._background.fill(WHITE)
+            pygame.draw.rect(self._background, RED, pygame.Rect(*self.frame_info.box1), 2)
+            pygame.draw.rect(self._background, RED, pygame.Rect(*self.frame_info.box2), 2)
+            pygame.draw.rect(self._background, RED, pygame.Rect(*self.frame_info.box3), 2)
+            self._drawn_prices = 0
+
+        # box3 graph, only the segments added since the last draw
+        rects = [self._draw_new_prices()]
+        if self._redraw_all:
+            self.display.blit(self._background, (0, 0))
+
+        # box1 and box2 text, over the background restored inside their borders
+        rects.append(self._draw_box1())
+        rects.append(self._draw_box2())
+
+        # update
+        if self._redraw_all:
+            pygame.display.flip()  # updates entire display
+            self._redraw_all = False
+        else:
+            pygame.display.update([rect for rect in rects if rect])  # only the changed regions
+
+    def _draw_new_prices(self):
+        start = max(self._drawn_prices - 1, 0)
+        if len(self.price_history) - start < 2:
+            return None
+        points = [
+            self._point_map(i, p)  # [(0, p_1), ..., (n, p_n)]
+            for i, p in enumerate(self.price_history[start:], start=start + 10)
+        ]
+        self._drawn_prices = len(self.price_history)
+        rect = pygame.draw.lines(surface=self._background, color=BLUE, closed=False, points=points)
+        self.display.blit(self._background, rect, rect)
+        return rect
+
+    def _clear_box(self, box) -> pygame.Rect:
+        inside = pygame.Rect(*box).inflate(-4, -4)
+        self.display.blit(self._background, inside, inside)
+        return inside
+
+    def _draw_box1(self) -> pygame.Rect:
         iter_text = font.render(f"Iteration: {str(self.iteration)}", True, BLACK)
         bal_text = font.render(f"Balance: {str(round(self.balance, 2))}", True, BLACK)
         asset_text = font.render(
@@ -210,12 +349,14 @@ class WalkGame(object):
 
         box1_x, box1_y = self.frame_info.box1[:2]
 
+        area = self._clear_box(self.frame_info.box1)
         self.display.blit(iter_text, [box1_x + 5, box1_y + 5])
         self.display.blit(bal_text, [box1_x + 5, box1_y + 30])
         self.display.blit(asset_text, [box1_x + 5, box1_y + 55])
         self.display.blit(value_text, [box1_x + 5, box1_y + 80])
+        return area
 
-        # box2 text
+    def _draw_box2(self) -> pygame.Rect:
         price_text = font.render(
             f"Current Price: {str(round(self.current_price, 2))}", True, BLACK
         )
@@ -226,14 +367,12 @@ class WalkGame(object):
 
         box2_x, box2_y = self.frame_info.box2[:2]
 
+        area = self._clear_box(self.frame_info.box2)
         self.display.blit(price_text, [box2_x + 5, box2_y + 5])
         self.display.blit(txn_p_text, [box2_x + 5, box2_y + 30])
         self.display.blit(txn_t_text, [box2_x + 5, box2_y + 55])
         self.display.blit(reward_text, [box2_x + 5, box2_y + 80])
-
-        # update
-        pygame.display.flip()  # updates entire display
-        # pygame.display.update()  # updates the portion of the screen passed as arg
+        return area
 
     @staticmethod
     def _font_render(key_text, key):
@@ -248,6 +387,79 @@ class WalkGame(object):
         return x, y
 
 
+def step(state, action) -> (WalkState, float, bool, float):
+    """
+    play_step on a WalkState instead of a game, returning the next state with the
+    reward, game over and total value, and leaving the given state as it was
+
+    action is the [buy, sell] list play_step takes, or a Keypress.
+    """
+    if not isinstance(action, Keypress):
+        if np.array_equal(action, [1, 0]):
+            action = Keypress.UP
+        elif np.array_equal(action, [0, 1]):
+            action = Keypress.DOWN
+        else:
+            action = Keypress.NONE
+    iteration = state.iteration + 1
+    price = state.current_price
+    balance = state.balance
+    asset_volume = state.asset_volume
+    last_transaction_price = state.last_transaction_price
+    last_transaction = state.last_transaction
+
+    # 1. update balances, as _buy_asset and _sell_asset
+    if action == Keypress.UP and balance > 0 and price * 1.01 > 0:
+        asset_volume = balance / (price * 1.01)
+        balance = 0
+        last_transaction_price = price
+        last_transaction = iteration
+    elif action == Keypress.DOWN and asset_volume > 0:
+        balance = asset_volume * (price / 1.01)
+        asset_volume = 0
+        last_transaction_price = price
+        last_transaction = iteration
+    total_value = balance + asset_volume * price
+
+    # 2. check if game over
+    if iteration > state.length or last_transaction + TIMEOUT < iteration:
+        reward = 0
+        if total_value < state.starting_balance or last_transaction + TIMEOUT < iteration:
+            reward = -10
+        return state._replace(
+            iteration=iteration, balance=balance, asset_volume=asset_volume,
+            last_transaction_price=last_transaction_price, last_transaction=last_transaction
+        ), reward, True, total_value
+
+    # 3. update price, with the draw _update_price would take (rng.uniform is a + (b - a) * random())
+    volatility = state.volatility
+    new_price = max(price + (-volatility + (volatility - -volatility) * state.draws[state.n_drawn]), 0)
+    total_value = balance + asset_volume * new_price
+    if state.history is not None and len(state.history[0]) < HISTORY_CHUNK:
+        history = (state.history[0] + (price,), state.history[1])
+    else:
+        history = ((price,), state.history)
+    return WalkState(
+        state.length, state.volatility, state.starting_balance, iteration, new_price, history,
+        state.n_prices + 1, balance, asset_volume, last_transaction_price, last_transaction, state.rng_state,
+        state.draws, state.n_drawn + 1, state.n_actions
+    ), total_value - state.starting_balance, False, total_value
+
+
+def history_list(history, n=None) -> list:
+    """
+    The last n prices (all of them by default) of a WalkState history, oldest first
+    """
+    chunks = []
+    count = 0
+    while history is not None and (n is None or count < n):
+        chunk, history = history
+        chunks.append(chunk)
+        count += len(chunk)
+    prices = [price for chunk in reversed(chunks) for price in chunk]
+    return prices if n is None else prices[-n:]
+
+
 if __name__ == '__main__':
     game = WalkGame(starting_price=100, volatility=3, length=1000)
 
@@ -0,0 +1,220 @@
+"""
+Actor/learner training for the snake agent
+
+Several actor processes play headless SnakeGameAI games with their own
+epsilon-greedy copy of Linear_QNet. Each writes transitions into its slots of a
+shared-memory block and hands a slot over once it is full. One learner process
+(the one running this module) moves full slots into replay memory, trains on
+it without pausing for the games, and publishes its weights to the actors every
+SYNC_EVERY updates.
+
+Actors use fixed exploration rates spread from 0.4 down to ~0.001, as in Ape-X
+(Horgan et al., 2018), rather than the 80 - n_games schedule of train(), since no
+single actor sees every game.
+"""
+
+import os
+import time
+import queue
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from snake_pygame import SnakeGameAI
+from model import Linear_QNet, QTrainer, select_actions
+from replay_memory import ReplayMemory, PrioritizedReplayMemory
+from agent import Agent, MAX_MEMORY, BATCH_SIZE, LR, GAMMA, HIDDEN_SIZE, PRIORITIZED_REPLAY
+
+
+N_ACTORS = max(os.cpu_count() - 1, 1)  # leave a core for the learner
+CHUNK = 256  # transitions an actor writes into a slot before handing it over
+SLOTS = 4  # slots per actor, so actors keep playing while the learner drains
+SYNC_EVERY = 100  # learner updates between weight broadcasts
+REPORT_EVERY = 10  # seconds between throughput lines
+
+STATE_SIZE = 11
+N_MOVES = 3
+
+
+class SharedSlots(object):
+    """
+    Transition buffers in shared memory, indexed [actor, slot, row]
+    """
+    def __init__(self, n_actors, n_slots, chunk, state_size):
+        shape = (n_actors, n_slots, chunk)
+        self.states = torch.zeros(shape + (state_size,), dtype=torch.uint8).share_memory_()
+        self.next_states = torch.zeros(shape + (state_size,), dtype=torch.uint8).share_memory_()
+        self.actions = torch.zeros(shape, dtype=torch.uint8).share_memory_()
+        self.rewards = torch.zeros(shape, dtype=torch.float32).share_memory_()
+        self.dones = torch.zeros(shape, dtype=torch.bool).share_memory_()
+
+    def arrays(self) -> tuple:
+        # numpy views onto the same shared memory
+        return (
+            self.states.numpy(), self.actions.numpy(), self.rewards.numpy(),
+            self.next_states.numpy(), self.dones.numpy()
+        )
+
+
+def actor_epsilon(actor_id, n_actors) -> float:
+    if n_actors == 1:
+        return 0.4
+    return 0.4 ** (1 + 7 * actor_id / (n_actors - 1))
+
+
+def run_actor(actor_id, n_actors, slots, free_slots, full_slots, scores, shared_model, version, stop):
+    torch.set_num_threads(1)  # one core per actor
+    np.random.seed(actor_id)
+
+    epsilon = actor_epsilon(actor_id, n_actors)
+    model = Linear_QNet(STATE_SIZE, HIDDEN_SIZE, N_MOVES)
+    with version.get_lock():
+        model.load_state_dict(shared_model.state_dict())
+        model_version = version.value
+
+    states, actions, rewards, next_states, dones = slots.arrays()
+    game = SnakeGameAI(headless=True)
+    state = Agent.get_state(game)
+    slot = free_slots.get()
+    row = 0
+    while not stop.is_set():
+        move = select_actions(model, np.expand_dims(state, 0), epsilon)[0]
+        final_move = [0] * N_MOVES
+        final_move[move] = 1
+
+        reward, done, score = game.play_step(final_move)
+        state_new = Agent.get_state(game)
+
+        states[actor_id, slot, row] = state
+        actions[actor_id, slot, row] = move
+        rewards[actor_id, slot, row] = reward
+        next_states[actor_id, slot, row] = state_new
+        dones[actor_id, slot, row] = done
+        row += 1
+
+        if done:
+            scores.put(score)
+            game.reset()
+            state_new = Agent.get_state(game)
+        state = state_new
+
+        if row == CHUNK:
+            full_slots.put((actor_id, slot))
+            slot = None
+            while slot is None and not stop.is_set():
+                try:
+                    slot = free_slots.get(timeout=1)
+                except queue.Empty:
+                    pass
+            row = 0
+
+            if version.value != model_version:
+                with version.get_lock():
+                    model.load_state_dict(shared_model.state_dict())
+                    model_version = version.value
+
+
+def train_distributed(n_actors=N_ACTORS, max_updates=None):
+    ctx = mp.get_context('spawn')
+
+    model = Linear_QNet(STATE_SIZE, HIDDEN_SIZE, N_MOVES)
+    trainer = QTrainer(model, LR, GAMMA)
+    if PRIORITIZED_REPLAY:
+        memory = PrioritizedReplayMemory(MAX_MEMORY, STATE_SIZE)
+    else:
+        memory = ReplayMemory(MAX_MEMORY, STATE_SIZE)
+
+    # the weights actors copy from, refreshed every SYNC_EVERY updates
+    shared_model = Linear_QNet(STATE_SIZE, HIDDEN_SIZE, N_MOVES)
+    shared_model.load_state_dict(model.state_dict())
+    shared_model.share_memory()
+    version = ctx.Value('i', 0)
+
+    slots = SharedSlots(n_actors, SLOTS, CHUNK, STATE_SIZE)
+    free_slots = [ctx.Queue() for _ in range(n_actors)]
+    for actor_queue in free_slots:
+        for slot in range(SLOTS):
+            actor_queue.put(slot)
+    full_slots = ctx.Queue()
+    scores = ctx.Queue()
+    stop = ctx.Event()
+
+    actors = [
+        ctx.Process(
+            target=run_actor,
+            args=(i, n_actors, slots, free_slots[i], full_slots, scores, shared_model, version, stop),
+            daemon=True
+        )
+        for i in range(n_actors)
+    ]
+    for actor in actors:
+        actor.start()
+
+    states, actions, rewards, next_states, dones = slots.arrays()
+    n_games = 0
+    record = 0
+    updates = 0
+    transitions = 0
+    last_report = time.perf_counter()
+    last_updates = last_transitions = 0
+    try:
+        while max_updates is None or updates < max_updates:
+            # 1. move every full slot into replay memory and hand it back to its actor
+            try:
+                # only wait for data while there is not enough to train on
+                actor_id, slot = full_slots.get(block=len(memory) < BATCH_SIZE, timeout=1)
+                while True:
+                    memory.push_batch(
+                        states[actor_id, slot], actions[actor_id, slot], rewards[actor_id, slot],
+                        next_states[actor_id, slot], dones[actor_id, slot]
+                    )
+                    free_slots[actor_id].put(slot)
+                    transitions += CHUNK
+                    actor_id, slot = full_slots.get_nowait()
+            except queue.Empty:
+                pass
+
+            # 2. train the long memory (experience)
+            if len(memory) >= BATCH_SIZE:
+                if PRIORITIZED_REPLAY:
+                    *batch, weights, idx = memory.sample(BATCH_SIZE)
+                    memory.update_priorities(idx, trainer.train_step(*batch, weights))
+                else:
+                    trainer.train_step(*memory.sample(BATCH_SIZE))
+                updates += 1
+
+                if updates % SYNC_EVERY == 0:
+                    with version.get_lock():
+                        shared_model.load_state_dict(model.state_dict())
+                        version.value += 1
+
+            # 3. record finished games
+            while True:
+                try:
+                    score = scores.get_nowait()
+                except queue.Empty:
+                    break
+                n_games += 1
+                if score > record:
+                    record = score
+                    model.save()
+                    print('Game', n_games, 'Score', score, 'Record', record)
+
+            now = time.perf_counter()
+            if now - last_report > REPORT_EVERY:
+                elapsed = now - last_report
+                print(
+                    'Games', n_games,
+                    'Transitions/sec', round((transitions - last_transitions) / elapsed),
+                    'Updates/sec', round((updates - last_updates) / elapsed, 1)
+                )
+                last_report, last_updates, last_transitions = now, updates, transitions
+    finally:
+        stop.set()
+        for actor in actors:
+            actor.join(timeout=5)
+            if actor.is_alive():
+                actor.terminate()
+
+
+if __name__ == '__main__':
+    train_distributed()
@@ -1,28 +1,62 @@
 
-import torch
-import random
+import os
 import numpy as np
-from collections import deque
 from snake_pygame import SnakeGameAI, Direction, Point
-from model import Linear_QNet, QTrainer
-from helper import plot
+from model import Linear_QNet, QTrainer, select_actions
+from replay_memory import ReplayMemory, PrioritizedReplayMemory
+from helper import MetricsLogger
+from checkpoint import Checkpointer, load_checkpoint
+from episode_log import EpisodeRecorder
+from profiler import PhaseTimer
+from scheduler import make_schedule
 
 
 MAX_MEMORY = 100000
 BATCH_SIZE = 1000
 LR = 0.001  # learning rate
+GAMMA = 0.9  # discount rate
+HIDDEN_SIZE = 256
+EXPLORE_GAMES = 80  # games before moves stop being picked at random
+
+HEADLESS = False  # train without a window at full CPU speed
+RENDER_EVERY = 0  # when headless, still show every Nth game (0 to never show)
+DRAW_EVERY = 1  # when showing a game, only draw every Nth frame
+PRIORITIZED_REPLAY = False  # sample long memory by TD error instead of uniformly
+METRICS_PATH = 'metrics.jsonl'  # per-game metrics are appended here
+LIVE_PLOT = True  # chart the metrics in a separate process
+CHECKPOINT_PATH = './model/checkpoint.pth'  # full training state, for resuming
+CHECKPOINT_EVERY_STEPS = 50000  # 0 to not checkpoint on env steps (checked as each game ends)
+CHECKPOINT_EVERY_SECONDS = 300  # 0 to not checkpoint on time
+RESUME = False  # carry on from CHECKPOINT_PATH if it exists
+MEMORY_PATH = None  # folder to memory-map the replay memory into, kept across restarts
+EPISODE_LOG = None  # file to record every game into for episode_viewer.py, e.g. 'episodes.bin'
+PROFILE_EVERY = 60  # seconds between time-per-phase summary lines, 0 to turn them off
+PROFILE_PATH = 'profile.json'  # the latest phase timings, rewritten with each summary line
+UPDATE_SCHEDULE = 'per_step'  # per_step (a batch-of-one update every move, as before), every_k, replay_ratio or episode_end
+UPDATE_EVERY = 4  # every_k: env steps between minibatch updates
+UPDATE_BATCH_SIZE = 32  # every_k and replay_ratio: minibatch size (BATCH_SIZE is for once-a-game batches)
+REPLAY_RATIO = 8  # replay_ratio: transitions replayed per new transition
+EPISODE_UPDATES = 1  # episode_end: minibatch updates per game
 
 
 class Agent(object):
-    def __init__(self):
+    def __init__(self, prioritized=False, memory_path=None, max_memory=MAX_MEMORY, batch_size=BATCH_SIZE,
+                 lr=LR, gamma=GAMMA, hidden_size=HIDDEN_SIZE, explore_games=EXPLORE_GAMES):
         self.n_games = 0
         self.epsilon = 0  # randomness
-        self.gamma = 0.9  # discount rate
-        self.memory = deque(maxlen=MAX_MEMORY)  # popleft() automatically
-        self.model = Linear_QNet(11, 256, 3)
-        self.trainer = QTrainer(self.model, LR, self.gamma)
+        self.gamma = gamma  # discount rate
+        self.batch_size = batch_size
+        self.explore_games = explore_games
+        self.prioritized = prioritized
+        if self.prioritized:
+            self.memory = PrioritizedReplayMemory(max_memory, 11, path=memory_path)
+        else:
+            self.memory = ReplayMemory(max_memory, 11, path=memory_path)  # overwrites the oldest once full
+        self.model = Linear_QNet(11, hidden_size, 3)
+        self.trainer = QTrainer(self.model, lr, self.gamma)
 
-    def get_state(self, game):
+    @staticmethod
+    def get_state(game):
         head = game.snake[0]
         point_l = Point(head.x - 20, head.y)
         point_r = Point(head.x + 20, head.y)
@@ -69,75 +103,126 @@ class Agent(object):
         return np.array(state, dtype=int)  # converts all True/False to 1/0
 
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))  # popleft if MAX_MEMORY is reached
-
-    def train_long_memory(self):
-        if len(self.memory) > BATCH_SIZE:
-            mini_sample = random.sample(self.memory, BATCH_SIZE)  # list of tuples
+        self.memory.push(state, action, reward, next_state, done)
+
+    def train_long_memory(self, batch_size=None):
+        batch_size = batch_size or self.batch_size
+        if self.prioritized:
+            states, actions, rewards, next_states, dones, weights, idx = self.memory.sample(batch_size)
+            td_errors = self.trainer.train_step(states, actions, rewards, next_states, dones, weights)
+            self.memory.update_priorities(idx, td_errors)
         else:
-            mini_sample = self.memory
-
-        states, actions, rewards, next_states, dones = zip(*mini_sample)
-        self.trainer.train_step(states, actions, rewards, next_states, dones)
+            states, actions, rewards, next_states, dones = self.memory.sample(batch_size)  # batched tensors
+            self.trainer.train_step(states, actions, rewards, next_states, dones)
 
     def train_short_memory(self, state, action, reward, next_state, done):
         self.trainer.train_step(state, action, reward, next_state, done)
 
     def get_action(self, state) -> list:
-        # random moves: tradeoff exploration / exploitation
-        self.epsilon = 80 - self.n_games
         final_move = [0, 0, 0]
-        if random.randint(0, 200) < self.epsilon:
-            move = random.randint(0, 2)  # 0, 1, or 2
-        else:
-            state0 = torch.tensor(state, dtype=torch.float)
-            prediction = self.model(state0)
-            move = torch.argmax(prediction).item()
+        move = self.get_actions(np.expand_dims(state, 0))[0]
         final_move[move] = 1
         return final_move
 
+    def get_actions(self, states) -> np.ndarray:
+        # random moves: tradeoff exploration / exploitation
+        # (same odds as the original random.randint(0, 200) < epsilon)
+        self.epsilon = self.explore_games - self.n_games
+        explore = min(max(self.epsilon, 0), 201) / 201
+        return select_actions(self.model, states, explore)
+
 
 def train():
-    plot_scores = []
-    plot_mean_scores = []
+    metrics = MetricsLogger(METRICS_PATH, plot=LIVE_PLOT, series=('score', 'mean_score'))
     total_score = 0
     record = 0
-    agent = Agent()
-    game = SnakeGameAI()
+    agent = Agent(prioritized=PRIORITIZED_REPLAY, memory_path=MEMORY_PATH)
+    n_steps = 0
+    checkpointer = Checkpointer(CHECKPOINT_PATH, CHECKPOINT_EVERY_STEPS, CHECKPOINT_EVERY_SECONDS)
+    if RESUME and os.path.exists(CHECKPOINT_PATH):
+        training = load_checkpoint(CHECKPOINT_PATH, agent)
+        total_score = training['total_score']
+        record = training['record']
+        n_steps = training.get('n_steps', 0)  # not in checkpoints from before steps were counted
+        checkpointer.resumed(n_steps)
+        print('Resumed at game', agent.n_games, 'Record', record)
+    game = SnakeGameAI(headless=HEADLESS, render_every=RENDER_EVERY, draw_every=DRAW_EVERY)
+    recorder = EpisodeRecorder(EPISODE_LOG, game.w, game.h) if EPISODE_LOG else None
+    timer = PhaseTimer(PROFILE_EVERY, PROFILE_PATH)
+    schedule = make_schedule(
+        UPDATE_SCHEDULE, agent.batch_size, UPDATE_BATCH_SIZE, UPDATE_EVERY, REPLAY_RATIO, EPISODE_UPDATES
+    )
+    print('Updates:', schedule.describe())
     while True:
         # get the old state
-        state_old = agent.get_state(game)
+        with timer.phase('get_state'):
+            state_old = agent.get_state(game)
 
         # get move
-        final_move = agent.get_action(state_old)
+        with timer.phase('get_action'):
+            final_move = agent.get_action(state_old)
 
         # perform move and get new state
-        reward, done, score = game.play_step(final_move)
-        state_new = agent.get_state(game)
+        with timer.phase('play_step'):
+            reward, done, score = game.play_step(final_move)
+        with timer.phase('get_state'):
+            state_new = agent.get_state(game)
+        timer.step()
+        n_steps += 1
 
         # train short memory
-        agent.train_short_memory(state_old, final_move, reward, state_new, done)
+        if schedule.short_memory:
+            with timer.phase('train_short_memory'):
+                agent.train_short_memory(state_old, final_move, reward, state_new, done)
+            timer.update()
 
         # remember
-        agent.remember(state_old, final_move, reward, state_new, done)
+        with timer.phase('remember'):
+            agent.remember(state_old, final_move, reward, state_new, done)
+
+        # minibatch updates due on this step
+        n_updates = schedule.step()
+        if n_updates:
+            with timer.phase('train_long_memory'):
+                for _ in range(n_updates):
+                    agent.train_long_memory(schedule.batch_size)
+            timer.update(n_updates)
 
         if done:
             # train the long memory (experience) and plot result
-            game.reset()
+            if recorder is not None:
+                with timer.phase('record'):
+                    recorder.record(agent.n_games + 1, game, score)
+            with timer.phase('play_step'):
+                game.reset()
             agent.n_games += 1
-            agent.train_long_memory()
+            n_updates = schedule.end_episode()
+            with timer.phase('train_long_memory'):
+                for _ in range(n_updates):
+                    agent.train_long_memory(schedule.batch_size)
+            timer.update(n_updates)
 
             if score > record:
                 record = score
-                agent.model.save()
+                with timer.phase('save'):
+                    checkpointer.save_model(agent.model)
 
             print('Game', agent.n_games, 'Score', score, 'Record', record)
 
-            plot_scores.append(score)
             total_score += score
             mean_score = total_score / agent.n_games
-            plot_mean_scores.append(mean_score)
-            plot(plot_scores, plot_mean_scores)
+            with timer.phase('plot'):
+                metrics.log(
+                    game=agent.n_games, score=score, mean_score=mean_score, record=record,
+                    updates_per_sec=schedule.updates_per_sec(), replay_ratio=schedule.replay_ratio()
+                )
+
+            if checkpointer.due(n_steps):
+                with timer.phase('checkpoint'):
+                    agent.memory.flush()
+                    checkpointer.save(agent, n_steps, total_score=total_score, record=record)
+            timer.end_episode()
+        timer.tick()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,255 @@
+"""
+Seeded benchmarks for the snake game, agent and trainer
+
+Run from this folder:
+    python benchmark.py                      # everything, printed as a table
+    python benchmark.py --json bench.json    # also write machine-readable results
+    python benchmark.py --only train_step    # benchmarks whose name contains a string
+
+Rendering is measured on SDL's dummy video driver with the SPEED clock cap
+removed, so it times the drawing work rather than the frame limiter.
+"""
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+import torch
+
+import snake_pygame
+from snake_pygame import SnakeGameAI
+from vec_env import VecSnakeEnv
+from bitboard_snake import BitboardSnake
+from agent import Agent, MAX_MEMORY
+from model import Linear_QNet, QTrainer
+from replay_memory import ReplayMemory
+
+MOVES = ([1, 0, 0], [0, 1, 0], [0, 0, 1])
+IMPORT_MODULES = ('snake_pygame', 'helper', 'episode_log', 'vec_env')  # modules worker processes import without needing torch
+IMPORT_BUDGET_MS = 1000  # per module in a fresh interpreter, mostly numpy and pygame themselves
+
+# run in a fresh interpreter: time the import, then check it started no display, fonts or plotting
+IMPORT_CHECK = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+import pygame
+assert not pygame.display.get_init() and not pygame.font.get_init(), 'importing {module} initialised pygame'
+assert 'matplotlib' not in sys.modules, 'importing {module} imported matplotlib'
+print(elapsed)
+'''
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def play_steps_per_sec(game, steps) -> float:
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, done, _ = game.play_step(random.choice(MOVES))
+        if done:
+            game.reset()
+    return steps / (time.perf_counter() - start)
+
+
+def bench_play_step(steps, render, grid=None) -> float:
+    snake_pygame.SPEED = 0  # no frame cap
+    if grid is None:
+        game = SnakeGameAI(headless=not render)
+    else:
+        game = SnakeGameAI(grid * snake_pygame.BLOCK_SIZE, grid * snake_pygame.BLOCK_SIZE, headless=not render)
+    return play_steps_per_sec(game, steps)
+
+
+def bench_bitboard_step(steps, grid) -> float:
+    engine = BitboardSnake(grid, grid, seed=random.getrandbits(32))
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, done, _ = engine.play_step(random.randrange(3))
+        if done:
+            engine.reset()
+    return steps / (time.perf_counter() - start)
+
+
+def bench_get_state(steps) -> float:
+    game = SnakeGameAI(headless=True)
+    total = 0
+    for _ in range(steps):
+        start = time.perf_counter()
+        Agent.get_state(game)
+        total += time.perf_counter() - start
+        _, done, _ = game.play_step(random.choice(MOVES))
+        if done:
+            game.reset()
+    return 1e6 * total / steps
+
+
+def bench_place_food(fill, repeats) -> float:
+    # grow the snake along a zig-zag path until it covers `fill` of the board
+    game = SnakeGameAI(headless=True)
+    cells = [
+        snake_pygame.Point(x if y % (2 * snake_pygame.BLOCK_SIZE) == 0 else game.w - snake_pygame.BLOCK_SIZE - x, y)
+        for y in range(0, game.h, snake_pygame.BLOCK_SIZE)
+        for x in range(0, game.w, snake_pygame.BLOCK_SIZE)
+    ]
+    target = int(fill * len(cells))
+    for pt in cells:
+        if len(game.snake) >= target:
+            break
+        if pt not in game.snake:
+            game._push_head(pt)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        game._place_food()
+    return 1e6 * (time.perf_counter() - start) / repeats
+
+
+def bench_vec_env(steps, n_envs) -> float:
+    env = VecSnakeEnv(n_envs, seed=np.random.randint(2 ** 31))
+    actions = np.random.randint(0, 3, size=(steps, n_envs))
+    start = time.perf_counter()
+    for i in range(steps):
+        env.step(actions[i])
+    return steps * n_envs / (time.perf_counter() - start)
+
+
+def bench_train_step(batch_size, repeats) -> float:
+    trainer = QTrainer(Linear_QNet(11, 256, 3), lr=0.001, gamma=0.9)
+    memory = ReplayMemory(batch_size, 11)
+    for _ in range(batch_size):
+        memory.push(
+            np.random.randint(0, 2, 11), random.randint(0, 2), random.choice([0, 10, -10]),
+            np.random.randint(0, 2, 11), random.random() < 0.1
+        )
+    batch = memory.sample(batch_size)
+    trainer.train_step(*batch)  # warm up
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        trainer.train_step(*batch)
+        times.append(time.perf_counter() - start)
+    return 1e3 * float(np.median(times))
+
+
+def bench_memory_bytes(n_transitions, legacy) -> float:
+    if not legacy:
+        return ReplayMemory(n_transitions, 11).nbytes / n_transitions
+
+    # the original deque of (state, one-hot move, reward, next_state, done) tuples
+    tracemalloc.start()
+    memory = deque(maxlen=MAX_MEMORY)
+    for _ in range(n_transitions):
+        move = [0, 0, 0]
+        move[random.randint(0, 2)] = 1
+        memory.append((
+            np.random.randint(0, 2, 11), move, random.choice([0, 10, -10]),
+            np.random.randint(0, 2, 11), random.random() < 0.1
+        ))
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used / n_transitions
+
+
+def bench_import(module) -> float:
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT_CHECK.format(module=module)], capture_output=True, text=True
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return 1e3 * float(result.stdout)
+
+
+def benchmarks(steps, repeats) -> list:
+    # (name, unit, params, function)
+    return [
+        *[
+            ('import', 'ms', {'module': module, 'budget_ms': IMPORT_BUDGET_MS}, lambda module=module: bench_import(module))
+            for module in IMPORT_MODULES
+        ],
+        ('play_step', 'steps/sec', {'render': False}, lambda: bench_play_step(steps, render=False)),
+        ('play_step', 'steps/sec', {'render': True}, lambda: bench_play_step(steps // 10, render=True)),
+        ('play_step', 'steps/sec', {'render': False, 'grid': 256},
+         lambda: bench_play_step(steps // 10, render=False, grid=256)),
+        *[
+            ('bitboard_step', 'steps/sec', {'grid': n}, lambda n=n: bench_bitboard_step(steps, n))
+            for n in (32, 256, 1024)
+        ],
+        ('get_state', 'us/call', {}, lambda: bench_get_state(steps)),
+        *[
+            ('place_food', 'us/call', {'fill': fill}, lambda fill=fill: bench_place_food(fill, repeats * 100))
+            for fill in (0.1, 0.5, 0.99)
+        ],
+        ('vec_env_step', 'transitions/sec', {'n_envs': 1000}, lambda: bench_vec_env(steps // 100, 1000)),
+        *[
+            ('train_step', 'ms', {'batch_size': n}, lambda n=n: bench_train_step(n, repeats))
+            for n in (1, 64, 1000)
+        ],
+        *[
+            ('replay_memory', 'bytes/transition', {'n': n, 'legacy': legacy},
+             lambda n=n, legacy=legacy: bench_memory_bytes(n, legacy))
+            for n in (10000, 100000)
+            for legacy in (True, False)
+        ],
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the snake game, agent and trainer')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--steps', type=int, default=20000, help='env steps per throughput benchmark')
+    parser.add_argument('--repeats', type=int, default=50, help='timed calls per latency benchmark')
+    parser.add_argument('--only', default='', help='run benchmarks whose name contains this')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    over_budget = []
+    for name, unit, params, func in benchmarks(args.steps, args.repeats):
+        if args.only not in name:
+            continue
+        seed_everything(args.seed)
+        value = func()
+        results.append({'name': name, 'params': params, 'value': round(value, 3), 'unit': unit})
+        print(f"{name:<16}{json.dumps(params):<48}{value:>14.3f} {unit}")
+        if 'budget_ms' in params and value > params['budget_ms']:
+            over_budget.append(f"{name} {json.dumps(params)}")
+
+    if args.json:
+        report = {
+            'project': 'snake-deep-q',
+            'seed': args.seed,
+            'steps': args.steps,
+            'repeats': args.repeats,
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if over_budget:
+        sys.exit('Over budget: ' + ', '.join(over_budget))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Snake on a packed bit board, for boards far larger than the 32x24 of SnakeGameAI
+
+Cells are single ints (y * grid_w + x) rather than pixel Points, and occupancy is
+one bit per cell in a bytearray, so a 1024x1024 board takes 128 KiB and a step
+touches two bits however big the board is. The body is a deque of cells for the
+O(1) tail pop. Moves, rewards, game over and scores follow SnakeGameAI.play_step
+exactly; only the food generator is drawn from differently, and a move that ends
+the game leaves the head where it was rather than on the wall or body it hit.
+
+Running this module checks it against SnakeGameAI (sharing food positions) and
+times steps as the board grows.
+"""
+
+import random
+from collections import deque
+import numpy as np
+
+# clockwise like SnakeGameAI._move: right, down, left, up
+DX = (1, 0, -1, 0)
+DY = (0, 1, 0, -1)
+TURNS = (0, 1, -1)  # [straight, right, left]
+FOOD_TRIES = 32  # random cells tried before counting through the free cells
+FREE_BITS = bytes(8 - bin(byte).count('1') for byte in range(256))  # free cells in each byte value
+
+
+class BitboardSnake(object):
+    def __init__(self, grid_w=32, grid_h=24, seed=None):
+        self.grid_w = grid_w
+        self.grid_h = grid_h
+        self.n_cells = grid_w * grid_h
+        self.rng = random.Random()
+        self.seed = None
+
+        self.bits = bytearray()  # bit c of the board is bit c % 8 of byte c // 8
+        self.snake = deque()  # cells, head first
+        self.head = 0
+        self.direction = 0  # index into DX/DY
+        self.food = 0
+        self.score = 0
+        self.frame_iteration = 0
+
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.rng.seed(self.seed)
+
+        self.bits = bytearray((self.n_cells + 7) // 8)
+        # the unused bits of the last byte count as occupied, so food never lands there
+        for cell in range(self.n_cells, 8 * len(self.bits)):
+            self._set(cell)
+
+        # same start as SnakeGameAI.reset: heading right from the middle, 3 long
+        x, y = self.grid_w // 2, self.grid_h // 2
+        self.head = y * self.grid_w + x
+        self.snake = deque([self.head, self.head - 1, self.head - 2])
+        for cell in self.snake:
+            self._set(cell)
+        self.direction = 0
+        self.score = 0
+        self.frame_iteration = 0
+        self._place_food()
+
+    def _set(self, cell):
+        self.bits[cell >> 3] |= 1 << (cell & 7)
+
+    def _clear(self, cell):
+        self.bits[cell >> 3] &= ~(1 << (cell & 7))
+
+    def occupied(self, cell) -> bool:
+        return self.bits[cell >> 3] >> (cell & 7) & 1
+
+    def is_collision(self, x, y) -> bool:
+        if x < 0 or x >= self.grid_w or y < 0 or y >= self.grid_h:
+            return True
+        return bool(self.occupied(y * self.grid_w + x))
+
+    def _place_food(self):
+        free = self.n_cells - len(self.snake)
+        if free == 0:
+            return  # the snake fills the board, so its next move ends the game
+
+        # nearly always a random cell is free within a few tries...
+        for _ in range(FOOD_TRIES):
+            cell = self.rng.randrange(self.n_cells)
+            if not self.occupied(cell):
+                self.food = cell
+                return
+
+        # ...but on a nearly full board count through to a random free cell instead
+        target = self.rng.randrange(free)
+        for i, byte in enumerate(self.bits):
+            if target < FREE_BITS[byte]:
+                for bit in range(8):
+                    if not byte >> bit & 1:
+                        if target == 0:
+                            self.food = 8 * i + bit
+                            return
+                        target -= 1
+            target -= FREE_BITS[byte]
+
+    def play_step(self, action) -> (int, bool, int):
+        # action is a move index, or one-hot [straight, right, left]
+        if not isinstance(action, (int, np.integer)):
+            action = int(np.argmax(action))
+        self.frame_iteration += 1
+
+        # 1. move
+        self.direction = (self.direction + TURNS[action]) % 4
+        x = self.head % self.grid_w + DX[self.direction]
+        y = self.head // self.grid_w + DY[self.direction]
+
+        # 2. check if game over (the tail has not moved yet, as in play_step)
+        if self.is_collision(x, y) or self.frame_iteration > 100 * (len(self.snake) + 1):
+            return -10, True, self.score
+        self.head = y * self.grid_w + x
+        self.snake.appendleft(self.head)
+        self._set(self.head)
+
+        # 3. place new food or just move
+        if self.head == self.food:
+            self.score += 1
+            self._place_food()
+            return 10, False, self.score
+        self._clear(self.snake.pop())
+        return 0, False, self.score
+
+    def get_state(self) -> np.ndarray:
+        """
+        The 11 features of Agent.get_state, from cell coordinates
+        """
+        x, y = self.head % self.grid_w, self.head // self.grid_w
+        food_x, food_y = self.food % self.grid_w, self.food // self.grid_w
+        d = self.direction
+        return np.array([
+            # danger straight, right, left
+            *(self.is_collision(x + DX[(d + turn) % 4], y + DY[(d + turn) % 4]) for turn in TURNS),
+            # move direction: left, right, up, down
+            d == 2, d == 0, d == 3, d == 1,
+            # food location: left, right, up, down
+            food_x < x, food_x > x, food_y < y, food_y > y,
+        ], dtype=np.uint8)
+
+
+if __name__ == '__main__':
+    import time
+    from snake_pygame import SnakeGameAI, BLOCK_SIZE
+    from agent import Agent
+
+    # 1. same moves, rewards, game over, scores and states as SnakeGameAI
+    random.seed(0)
+    game = SnakeGameAI(headless=True)
+    engine = BitboardSnake(game.w // BLOCK_SIZE, game.h // BLOCK_SIZE)
+    engine.food = int(game.food.y // BLOCK_SIZE * engine.grid_w + game.food.x // BLOCK_SIZE)
+    checked = 0
+    for _ in range(50000):
+        assert np.array_equal(Agent.get_state(game), engine.get_state())
+        action = random.randrange(3)
+        final_move = [0, 0, 0]
+        final_move[action] = 1
+        expected = game.play_step(final_move)
+        assert engine.play_step(action) == expected, (expected, checked)
+        checked += 1
+        if expected[1]:
+            game.reset()
+            engine.reset()
+        engine.food = int(game.food.y // BLOCK_SIZE * engine.grid_w + game.food.x // BLOCK_SIZE)
+    print('Matched SnakeGameAI on', checked, 'steps')
+
+    # 2. steps per second as the board grows
+    for size in (32, 256, 1024, 4096):
+        engine = BitboardSnake(size, size, seed=0)
+        start = time.perf_counter()
+        for _ in range(20000):
+            _, done, _ = engine.play_step(random.randrange(3))
+            if done:
+                engine.reset()
+        elapsed = time.perf_counter() - start
+        print(f'{size}x{size} board: {round(20000 / elapsed)} steps/sec, {len(engine.bits)} bytes of occupancy')
@@ -0,0 +1,110 @@
+"""
+Resumable checkpoints of the whole training state, written off the training thread
+
+A checkpoint holds the model and Adam optimiser state, n_games (which drives the
+epsilon schedule), the env steps taken, any extra training counters, and the
+random, numpy and torch RNG states. The training thread only clones that state; a background thread
+pickles it to a temporary file and renames it over the old checkpoint, so a run
+killed mid-write still leaves the previous checkpoint intact.
+"""
+
+import copy
+import os
+import queue
+import random
+import threading
+import time
+import numpy as np
+import torch
+
+
+class Checkpointer(object):
+    def __init__(self, path='./model/checkpoint.pth', every_steps=50000, every_seconds=300):
+        self.path = path
+        self.every_steps = every_steps  # 0 to not checkpoint on env steps
+        self.every_seconds = every_seconds  # 0 to not checkpoint on time
+        self._last_steps = 0
+        self._last_time = time.monotonic()
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def resumed(self, n_steps):
+        # count the next interval from the restored step, not from a fresh start
+        self._last_steps = n_steps
+
+    def due(self, n_steps) -> bool:
+        if self.every_steps and n_steps - self._last_steps >= self.every_steps:
+            return True
+        return bool(self.every_seconds) and time.monotonic() - self._last_time >= self.every_seconds
+
+    def save(self, agent, n_steps, **training):
+        self._last_steps = n_steps
+        self._last_time = time.monotonic()
+        self._queue.put((self.path, capture(agent, n_steps=n_steps, **training)))
+
+    def save_model(self, model, file_name='model.pth'):
+        # the same file Linear_QNet.save writes, without holding up training
+        state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        self._queue.put((os.path.join('./model', file_name), state))
+
+    def close(self):
+        # wait for anything queued to be written
+        self._queue.put(None)
+        self._thread.join()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            path, obj = item
+            write_atomic(obj, path)
+
+
+def capture(agent, **training) -> dict:
+    np_state = np.random.get_state()
+    return {
+        'model': {k: v.detach().clone() for k, v in agent.model.state_dict().items()},
+        'optimiser': copy.deepcopy(agent.trainer.optimiser.state_dict()),
+        'n_games': agent.n_games,
+        'epsilon': agent.epsilon,
+        'training': training,
+        'rng': {
+            'random': random.getstate(),
+            'numpy': (np_state[0], np_state[1].tolist(), *np_state[2:]),
+            'torch': torch.get_rng_state(),
+        },
+    }
+
+
+def write_atomic(obj, path):
+    folder = os.path.dirname(path) or '.'
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, agent) -> dict:
+    """
+    Restore agent (model, optimiser, n_games and epsilon) and the global RNGs from
+    a checkpoint, returning the extra training counters it was saved with
+    """
+    checkpoint = torch.load(path)
+    agent.model.load_state_dict(checkpoint['model'])
+    agent.trainer.optimiser.load_state_dict(checkpoint['optimiser'])
+    agent.n_games = checkpoint['n_games']
+    agent.epsilon = checkpoint['epsilon']
+
+    rng = checkpoint['rng']
+    random.setstate(rng['random'])
+    np_state = rng['numpy']
+    np.random.set_state((np_state[0], np.array(np_state[1], dtype=np.uint32), *np_state[2:]))
+    torch.set_rng_state(rng['torch'])
+    return checkpoint['training']
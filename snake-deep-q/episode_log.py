@@ -0,0 +1,74 @@
+"""
+Compact binary logs of whole snake games
+
+A log is a short header (the board size) followed by one record per game: the
+game number, the seed of the game's food generator, the final score, and then
+one byte per action (0 straight, 1 right, 2 left). Since SnakeGameAI always
+starts from the same position, that is all it takes to replay a game exactly
+(see episode_viewer.py), at roughly a kilobyte for a long game.
+"""
+
+import os
+import struct
+from collections import namedtuple
+
+MAGIC = b'SNKE'
+VERSION = 2  # 2: food drawn from a free-cell list, so version 1 seeds place it differently
+HEADER = struct.Struct('<4sBHH')  # magic, version, board width, board height
+RECORD = struct.Struct('<IQiI')  # game, seed, score, number of actions
+
+Episode = namedtuple('Episode', 'game, seed, score, actions')
+
+
+class EpisodeRecorder(object):
+    """
+    Appends finished games to a log, creating it if it does not exist yet
+    """
+    def __init__(self, path, w=640, h=480):
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                board = read_header(f)
+            if board != (w, h):
+                raise ValueError(f'{path} holds games on a {board} board, not {(w, h)}')
+            self._file = open(path, 'ab')
+        else:
+            self._file = open(path, 'wb')
+            self._file.write(HEADER.pack(MAGIC, VERSION, w, h))
+
+    def record(self, number, game, score):
+        # call before game.reset(), which starts a new list of actions
+        self._file.write(RECORD.pack(number, game.seed, score, len(game.actions)))
+        self._file.write(game.actions)
+        self._file.flush()  # once a game, so a killed run keeps every finished game
+
+    def close(self):
+        self._file.close()
+
+
+def read_header(f) -> tuple:
+    magic, version, w, h = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'not a version {VERSION} snake episode log')
+    return w, h
+
+
+def read_log(path) -> (tuple, list):
+    """
+    The board size and every complete game in a log
+    """
+    with open(path, 'rb') as f:
+        board = read_header(f)
+        data = f.read()
+
+    episodes = []
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        game, seed, score, n_actions = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        actions = data[offset:offset + n_actions]
+        if len(actions) < n_actions:
+            break  # cut off mid-write
+        offset += n_actions
+        episodes.append(Episode(game, seed, score, actions))
+    return board, episodes
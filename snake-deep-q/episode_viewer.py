@@ -0,0 +1,71 @@
+"""
+Replay games from an episode log
+
+Run from this folder:
+    python episode_viewer.py episodes.bin                  # list the logged games
+    python episode_viewer.py episodes.bin --best           # watch the highest scoring game
+    python episode_viewer.py episodes.bin --game 120 --speed 200
+    python episode_viewer.py episodes.bin --check          # replay every game headless
+
+A game is replayed by seeding SnakeGameAI the same way and feeding it the
+logged actions, so it plays out exactly as it did in training.
+"""
+
+import argparse
+import snake_pygame
+from snake_pygame import SnakeGameAI
+from episode_log import read_log
+
+MOVES = ([1, 0, 0], [0, 1, 0], [0, 0, 1])
+
+
+def replay(episode, board, headless=False) -> int:
+    game = SnakeGameAI(*board, headless=headless)
+    game.reset(seed=episode.seed)
+    score = 0
+    for action in episode.actions:
+        _, done, score = game.play_step(MOVES[action])
+        if done:
+            break
+    return score
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay logged snake games')
+    parser.add_argument('path', help='episode log written during training')
+    parser.add_argument('--game', type=int, help='game number to replay')
+    parser.add_argument('--best', action='store_true', help='replay the highest scoring game')
+    parser.add_argument('--speed', type=int, default=snake_pygame.SPEED, help='frames per second, 0 for no limit')
+    parser.add_argument('--check', action='store_true', help='replay every game headless and compare scores')
+    args = parser.parse_args(argv)
+
+    board, episodes = read_log(args.path)
+    if args.check:
+        mismatches = 0
+        for episode in episodes:
+            score = replay(episode, board, headless=True)
+            if score != episode.score:
+                mismatches += 1
+                print('Game', episode.game, 'logged score', episode.score, 'replayed score', score)
+        print('Replayed', len(episodes), 'games,', mismatches, 'mismatches')
+        return
+
+    if args.best:
+        chosen = [max(episodes, key=lambda episode: episode.score)]
+    elif args.game is not None:
+        chosen = [episode for episode in episodes if episode.game == args.game]
+    else:
+        for episode in episodes:
+            print('Game', episode.game, 'Score', episode.score, 'Steps', len(episode.actions))
+        return
+    if not chosen:
+        parser.error('no such game in the log')
+
+    snake_pygame.SPEED = args.speed
+    for episode in chosen:
+        score = replay(episode, board)
+        print('Game', episode.game, 'Score', score, '(logged', str(episode.score) + ')')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Export a trained Linear_QNet for fast CPU inference
+
+Run from this folder:
+    python export.py                                 # ./model/model.pth -> ./model/model_script.pt, model_int8.pt
+    python export.py --model ./model/other.pth --states 50000
+
+Writes a TorchScript copy of the fp32 network and a TorchScript copy of an int8
+dynamically quantised one (weights stored as int8, activations quantised on the
+fly), which both load with torch.jit.load and no model.py. Then checks how often
+each picks the same move as the original network on states from random play,
+and compares their latency at batch sizes 1 and 1024.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from model import load_policy
+from state_encoder import encode_states
+from vec_env import VecSnakeEnv
+
+BATCH_SIZES = (1, 1024)
+
+
+def export(model, folder, name) -> dict:
+    """
+    TorchScript fp32 and int8 versions of model, saved next to it
+    """
+    variants = {
+        'script': torch.jit.script(model),
+        'int8': torch.jit.script(torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)),
+    }
+    for suffix, module in variants.items():
+        path = os.path.join(folder, f'{name}_{suffix}.pt')
+        torch.jit.save(module, path)
+        print('Saved', path, os.path.getsize(path), 'bytes')
+    return variants
+
+
+def sample_states(n, seed) -> torch.Tensor:
+    # states from many boards of random play, as the network sees them early in training
+    env = VecSnakeEnv(1000, seed=seed)
+    rng = np.random.default_rng(seed)
+    states = []
+    for _ in range(-(-n // env.n_envs)):
+        states.append(encode_states(env.heads, env.directions, env.food, env.body))
+        env.step(rng.integers(0, 3, env.n_envs))
+    return torch.as_tensor(np.concatenate(states)[:n], dtype=torch.float)
+
+
+def latency_ms(module, states, batch_size, repeats) -> float:
+    batch = states[:batch_size]
+    with torch.inference_mode():
+        for _ in range(10):  # warm up (TorchScript optimises on the first calls)
+            module(batch)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            module(batch)
+            times.append(time.perf_counter() - start)
+    return 1e3 * float(np.median(times))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export a trained Linear_QNet to TorchScript fp32 and int8')
+    parser.add_argument('--model', default='./model/model.pth', help='state dict saved by Linear_QNet.save')
+    parser.add_argument('--states', type=int, default=10000, help='states to check action agreement on')
+    parser.add_argument('--repeats', type=int, default=200, help='timed calls per latency measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    model = load_policy(args.model)
+    folder, file_name = os.path.split(args.model)
+    variants = {'eager': model, **export(model, folder, os.path.splitext(file_name)[0])}
+
+    states = sample_states(max(args.states, max(BATCH_SIZES)), args.seed)
+    with torch.inference_mode():
+        reference = model(states[:args.states])
+        actions = torch.argmax(reference, dim=1)
+        for name, module in variants.items():
+            q_values = module(states[:args.states])
+            agreement = (torch.argmax(q_values, dim=1) == actions).float().mean().item()
+            latencies = [latency_ms(module, states, n, args.repeats) for n in BATCH_SIZES]
+            print(
+                f"{name:<8}"
+                f"agreement {100 * agreement:7.3f}%  "
+                f"max |dQ| / max |Q| {((q_values - reference).abs().max() / reference.abs().max()).item():.2e}  "
+                + '  '.join(f"batch {n} {ms:.4f} ms" for n, ms in zip(BATCH_SIZES, latencies))
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Serve a trained Linear_QNet to local game clients
+
+Run from this folder:
+    python inference_server.py                                    # ./model/model.pth on 127.0.0.1:8765
+    python inference_server.py --address /tmp/policy.sock         # on a Unix socket instead
+    python inference_server.py --model ../random-walk-deep-q/model/model.pth --max-wait 0.002
+
+Requests that arrive within --max-wait seconds of each other (up to
+--max-batch of them) go through the network as one batch, so many clients
+cost about as much as one. The layer sizes are read from the checkpoint, so
+either project's model.pth can be served, and this is the only copy of the
+server and of load_test.py.
+
+The protocol is little-endian binary over a stream:
+    request   uint16 n, then n float32 state features
+    response  uint8 greedy action, uint16 m, then m float32 Q values
+A request with n = 0xFFFF instead gets a uint32 length and that many bytes
+of JSON server stats (latency percentiles, counters, layer sizes).
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import time
+from collections import deque
+
+import numpy as np
+import torch
+from model import load_policy
+
+ADDRESS = '127.0.0.1:8765'
+MAX_BATCH = 256  # requests run through the network at once
+MAX_WAIT = 0.001  # seconds the first request of a batch waits for others
+REPORT_EVERY = 10  # seconds between stats lines, 0 to not print them
+
+REQUEST = struct.Struct('<H')
+RESPONSE = struct.Struct('<BH')
+STATS_REQUEST = 0xFFFF
+STATS_LENGTH = struct.Struct('<I')
+
+
+def parse_address(address) -> tuple:
+    # host:port for TCP, anything else is a Unix socket path
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return host, int(port)
+    return address, None
+
+
+async def open_connection(address):
+    host, port = parse_address(address)
+    if port is None:
+        return await asyncio.open_unix_connection(host)
+    return await asyncio.open_connection(host, port)
+
+
+def encode_request(state) -> bytes:
+    state = np.asarray(state, dtype='<f4')
+    return REQUEST.pack(len(state)) + state.tobytes()
+
+
+async def read_response(reader) -> (int, np.ndarray):
+    action, n_moves = RESPONSE.unpack(await reader.readexactly(RESPONSE.size))
+    q_values = np.frombuffer(await reader.readexactly(4 * n_moves), dtype='<f4')
+    return action, q_values
+
+
+async def request_stats(reader, writer) -> dict:
+    writer.write(REQUEST.pack(STATS_REQUEST))
+    await writer.drain()
+    (length,) = STATS_LENGTH.unpack(await reader.readexactly(STATS_LENGTH.size))
+    return json.loads(await reader.readexactly(length))
+
+
+class PolicyClient(object):
+    """
+    Blocking client for a game loop: act(state) returns (action, Q values)
+    """
+    def __init__(self, address=ADDRESS):
+        host, port = parse_address(address)
+        if port is None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(host)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile('rb')
+
+    def act(self, state) -> (int, np.ndarray):
+        self.sock.sendall(encode_request(state))
+        action, n_moves = RESPONSE.unpack(self.file.read(RESPONSE.size))
+        return action, np.frombuffer(self.file.read(4 * n_moves), dtype='<f4')
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class InferenceServer(object):
+    def __init__(self, model, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.model = model
+        self.input_size = model.linear1.in_features
+        self.output_size = model.linear2.out_features
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self.pending = None  # queue of (state, future, arrival time), made in the serving loop
+        self.latencies = deque(maxlen=100000)  # seconds from request read to reply ready
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+
+    def stats(self) -> dict:
+        latencies = np.array(self.latencies)
+        p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) else (0, 0)
+        elapsed = time.perf_counter() - self.started
+        return {
+            'input_size': self.input_size,
+            'output_size': self.output_size,
+            'requests': self.requests,
+            'batches': self.batches,
+            'errors': self.errors,
+            'mean_batch': self.requests / max(self.batches, 1),
+            'requests_per_sec': self.requests / elapsed,
+            'p50_ms': 1e3 * float(p50),
+            'p99_ms': 1e3 * float(p99),
+        }
+
+    async def serve(self, address=ADDRESS, report_every=REPORT_EVERY):
+        self.pending = asyncio.Queue()
+        host, port = parse_address(address)
+        if port is None:
+            server = await asyncio.start_unix_server(self.handle_client, host)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        print('Serving', self.input_size, '->', self.output_size, 'Q-network on', address)
+
+        tasks = [asyncio.create_task(self.run_batches())]
+        if report_every:
+            tasks.append(asyncio.create_task(self.report(report_every)))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                (n,) = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+                if n == STATS_REQUEST:
+                    stats = json.dumps(self.stats()).encode()
+                    writer.write(STATS_LENGTH.pack(len(stats)) + stats)
+                    await writer.drain()
+                    continue
+
+                state = np.frombuffer(await reader.readexactly(4 * n), dtype='<f4')
+                if n != self.input_size:
+                    self.errors += 1
+                    break  # the wrong model for this client, so hang up
+                future = asyncio.get_running_loop().create_future()
+                await self.pending.put((state, future, time.perf_counter()))
+                writer.write(await future)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # client went away
+        finally:
+            writer.close()
+
+    async def run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # 1. wait for a request, then up to max_wait for more to join it
+            batch = [await self.pending.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.pending.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            while len(batch) < self.max_batch and not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+
+            # 2. one forward pass for the whole batch
+            states = torch.from_numpy(np.stack([state for state, _, _ in batch]))
+            with torch.inference_mode():
+                q_values = self.model(states).numpy()
+            actions = np.argmax(q_values, axis=1)
+
+            # 3. reply to each client
+            now = time.perf_counter()
+            for (_, future, arrived), action, q in zip(batch, actions, q_values):
+                if not future.cancelled():
+                    future.set_result(RESPONSE.pack(action, len(q)) + q.astype('<f4').tobytes())
+                self.latencies.append(now - arrived)
+            self.requests += len(batch)
+            self.batches += 1
+
+    async def report(self, every):
+        while True:
+            await asyncio.sleep(every)
+            stats = self.stats()
+            print(
+                'Requests', stats['requests'],
+                'Requests/sec', round(stats['requests_per_sec']),
+                'Mean batch', round(stats['mean_batch'], 1),
+                'p50 ms', round(stats['p50_ms'], 3),
+                'p99 ms', round(stats['p99_ms'], 3)
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a trained Linear_QNet to local game clients')
+    parser.add_argument('--model', default='./model/model.pth', help='state dict saved by Linear_QNet.save')
+    parser.add_argument('--address', default=ADDRESS, help='host:port, or a Unix socket path')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='most requests per forward pass')
+    parser.add_argument('--max-wait', type=float, default=MAX_WAIT, help='seconds to wait for a batch to fill')
+    parser.add_argument('--report-every', type=float, default=REPORT_EVERY, help='seconds between stats lines')
+    args = parser.parse_args(argv)
+
+    torch.set_num_threads(1)  # small batches, so threads only add overhead
+    server = InferenceServer(load_policy(args.model), args.max_batch, args.max_wait)
+    try:
+        asyncio.run(server.serve(args.address, args.report_every))
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Load test for inference_server.py
+
+Start a server, then from this folder:
+    python load_test.py                                   # 32 clients, 1000 requests each
+    python load_test.py --clients 128 --requests 200 --address /tmp/policy.sock
+
+Each client sends a random state, waits for the reply and sends the next, like
+a game loop asking for its moves. Client-side latency and throughput are
+printed alongside the server's own stats.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+from inference_server import ADDRESS, open_connection, encode_request, read_response, request_stats
+
+
+async def run_client(address, input_size, n_requests, seed) -> list:
+    rng = np.random.default_rng(seed)
+    reader, writer = await open_connection(address)
+    latencies = []
+    for _ in range(n_requests):
+        request = encode_request(rng.integers(0, 2, input_size))
+        start = time.perf_counter()
+        writer.write(request)
+        await writer.drain()
+        await read_response(reader)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+    return latencies
+
+
+async def load_test(address, n_clients, n_requests) -> dict:
+    reader, writer = await open_connection(address)
+    before = await request_stats(reader, writer)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        run_client(address, before['input_size'], n_requests, seed)
+        for seed in range(n_clients)
+    ])
+    elapsed = time.perf_counter() - start
+
+    after = await request_stats(reader, writer)
+    writer.close()
+    latencies = np.concatenate(results)
+    return {
+        'clients': n_clients,
+        'requests': len(latencies),
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': 1e3 * float(np.percentile(latencies, 50)),
+        'p99_ms': 1e3 * float(np.percentile(latencies, 99)),
+        'server_mean_batch': (after['requests'] - before['requests']) / max(after['batches'] - before['batches'], 1),
+        'server': after,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test a running inference_server.py')
+    parser.add_argument('--address', default=ADDRESS, help='host:port, or a Unix socket path')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent connections')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per client')
+    args = parser.parse_args(argv)
+
+    print(json.dumps(asyncio.run(load_test(args.address, args.clients, args.requests)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
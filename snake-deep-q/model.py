@@ -3,6 +3,7 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
+import numpy as np
 import os
 
 # TODO: watch the PyTorch YouTube tutorial from Python Engineer
@@ -36,12 +37,14 @@ class QTrainer:  # (object):
         self.optimiser = optim.Adam(model.parameters(), lr=self.lr)
         self.criterion = nn.MSELoss()
 
-    def train_step(self, state, action, reward, next_state, done):
+    def train_step(self, state, action, reward, next_state, done, weights=None):
         # if multiple values, then these will be (n, x)
-        state = torch.tensor(state, dtype=torch.float)
-        next_state = torch.tensor(next_state, dtype=torch.float)
-        action = torch.tensor(action, dtype=torch.long)
-        reward = torch.tensor(reward, dtype=torch.float)
+        # weights are per-row importance-sampling weights from prioritised replay
+        state = _as_tensor(state, torch.float)
+        next_state = _as_tensor(next_state, torch.float)
+        action = _as_tensor(action, torch.long)
+        reward = _as_tensor(reward, torch.float)
+        done = _as_tensor(done, torch.bool)
 
         if len(state.shape) == 1:
             # only 1 number, so reshape as (1, x)
@@ -49,24 +52,125 @@ class QTrainer:  # (object):
             next_state = torch.unsqueeze(next_state, 0)
             action = torch.unsqueeze(action, 0)
             reward = torch.unsqueeze(reward, 0)
-            done = (done, )  # tuple with only 1 value
+            done = torch.unsqueeze(done, 0)
+
+        if len(action.shape) == 2:
+            # one-hot moves, so take the index of the move made in each row
+            action = torch.argmax(action, dim=1)
 
         # 1: get the predicted Q values with the current state
-        pred = self.model(state)  # this is 3 values
+        pred = self.model(state)  # this is 3 values per row
 
-        target = pred.clone()
-        for idx in range(len(done)):
-            q_new = reward[idx]
-            if not done[idx]:
-                q_new = reward[idx] + self.gamma * torch.max(self.model(next_state[idx]))
+        # 2: q_new = reward + gamma * max(next_predicted Q value) -> only if not done
+        #    one forward pass over every next state, outside of autograd
+        with torch.no_grad():
+            next_q = torch.max(self.model(next_state), dim=1).values
+        q_new = reward + self.gamma * next_q * ~done
 
-            target[idx][torch.argmax(action).item()] = q_new
+        # 3: target is pred with the Q value of the move made in each row swapped for q_new
+        target = pred.detach().clone()
+        target.scatter_(1, action.unsqueeze(1), q_new.unsqueeze(1))
+
+        # TD errors of the moves made, used to re-prioritise replayed transitions
+        td_errors = q_new - pred.detach().gather(1, action.unsqueeze(1)).squeeze(1)
 
-        # 2: q_new = reward + gamma * max(next_predicted Q value) -> only if not done
-        # pred.clone()
-        # preds[argmax(action)] = q_new
         self.optimiser.zero_grad()
-        loss = self.criterion(target, pred)
+        if weights is None:
+            loss = self.criterion(target, pred)
+        else:
+            weights = _as_tensor(weights, torch.float)
+            loss = torch.mean(weights * torch.mean((target - pred) ** 2, dim=1))
         loss.backward()
 
         self.optimiser.step()
+
+        return td_errors
+
+
+def load_policy(path) -> Linear_QNet:
+    """
+    A Linear_QNet in eval mode from a state dict saved by Linear_QNet.save, with
+    the layer sizes read from the weights
+    """
+    state_dict = torch.load(path)
+    hidden_size, input_size = state_dict['linear1.weight'].shape
+    output_size = state_dict['linear2.weight'].shape[0]
+    model = Linear_QNet(input_size, hidden_size, output_size)
+    model.load_state_dict(state_dict)
+    model.eval()
+    return model
+
+
+def select_actions(model, states, epsilon) -> np.ndarray:
+    """
+    Epsilon-greedy move indices for a stacked (n, x) batch of states
+
+    One forward pass under inference mode picks the greedy moves, then each row is
+    swapped for a random move with probability epsilon (a float, or one per row).
+    """
+    states = _as_tensor(states, torch.float)
+    with torch.inference_mode():
+        q_values = model(states)
+    greedy = torch.argmax(q_values, dim=1).numpy()
+    n, n_moves = q_values.shape
+
+    explore = np.random.random(n) < epsilon
+    return np.where(explore, np.random.randint(0, n_moves, size=n), greedy)
+
+
+def _as_tensor(values, dtype):
+    # tuples of arrays go through one numpy array rather than torch's slow nested-sequence path
+    if not torch.is_tensor(values):
+        values = np.asarray(values)
+    return torch.as_tensor(values, dtype=dtype)
+
+
+if __name__ == '__main__':
+    # the batched train_step against the original per-sample Bellman update on one random batch
+    torch.manual_seed(0)
+    np.random.seed(0)
+    input_size, hidden_size, output_size = 11, 256, 3
+    batch_size = 1000
+    states = np.random.random((batch_size, input_size))
+    next_states = np.random.random((batch_size, input_size))
+    actions = np.eye(output_size, dtype=int)[np.random.randint(0, output_size, batch_size)]
+    rewards = np.random.choice([-10.0, 0.0, 10.0], batch_size)
+    dones = np.random.random(batch_size) < 0.1
+
+    batched = Linear_QNet(input_size, hidden_size, output_size)
+    reference = Linear_QNet(input_size, hidden_size, output_size)
+    reference.load_state_dict(batched.state_dict())
+    batched_trainer = QTrainer(batched, 0.001, 0.9)
+    reference_trainer = QTrainer(reference, 0.001, 0.9)
+
+    # the loop train_step used to run, one forward pass per non-terminal row
+    # (with the targets held fixed, as the batched update does)
+    state = torch.tensor(states, dtype=torch.float)
+    next_state = torch.tensor(next_states, dtype=torch.float)
+    pred = reference(state)
+    target = pred.detach().clone()
+    expected_td = torch.zeros(batch_size)
+    with torch.no_grad():
+        for idx in range(batch_size):
+            q_new = rewards[idx]
+            if not dones[idx]:
+                q_new = rewards[idx] + reference_trainer.gamma * torch.max(reference(next_state[idx]))
+            move = torch.argmax(torch.tensor(actions[idx])).item()
+            target[idx][move] = q_new
+            expected_td[idx] = target[idx][move] - pred[idx][move]
+    reference_trainer.optimiser.zero_grad()
+    reference_trainer.criterion(target, pred).backward()
+    reference_trainer.optimiser.step()
+
+    td_errors = batched_trainer.train_step(states, actions, rewards, next_states, dones)
+
+    td_diff = (td_errors - expected_td).abs().max().item()
+    param_diff = max(
+        (a - b).abs().max().item() for a, b in zip(batched.parameters(), reference.parameters())
+    )
+    assert td_diff < 1e-4, td_diff
+    assert param_diff < 1e-5, param_diff
+    print(
+        'Matched the per-sample update on', batch_size, 'rows: max target difference', td_diff,
+        'max parameter difference', param_diff
+    )
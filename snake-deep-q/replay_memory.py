@@ -0,0 +1,221 @@
+"""
+Replay memory backed by preallocated arrays
+
+Transitions are written into fixed numpy arrays as a ring buffer (the oldest is
+overwritten once full, like deque(maxlen=...)), and moves are stored as their index
+rather than a one-hot list. Sampling fancy-indexes the arrays straight into tensors
+that QTrainer.train_step can use as they are.
+
+Given a path, the arrays are memory-mapped .npy files in that folder instead, so
+the memory can be far bigger than RAM, sampling only reads the rows it needs, and
+a restarted run reopens whatever was flushed last time.
+
+PrioritizedReplayMemory samples in proportion to TD error (Schaul et al., 2015)
+using a sum-tree over the same slots.
+"""
+
+import json
+import os
+import random
+import numpy as np
+import torch
+
+
+class ReplayMemory(object):
+    def __init__(self, capacity, state_size, state_dtype=np.uint8, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.position = 0  # next slot to write
+        self.size = 0
+
+        if self.path is None:
+            self.states = np.zeros((capacity, state_size), dtype=state_dtype)
+            self.next_states = np.zeros((capacity, state_size), dtype=state_dtype)
+            self.actions = np.zeros(capacity, dtype=np.uint8)
+            self.rewards = np.zeros(capacity, dtype=np.float32)
+            self.dones = np.zeros(capacity, dtype=np.bool_)
+        else:
+            self._open(state_size, state_dtype)
+
+    def _open(self, state_size, state_dtype):
+        meta_path = os.path.join(self.path, 'meta.json')
+        meta = {
+            'capacity': self.capacity,
+            'state_size': state_size,
+            'state_dtype': np.dtype(state_dtype).name,
+        }
+        reopen = os.path.exists(meta_path)
+        if reopen:
+            with open(meta_path) as f:
+                saved = json.load(f)
+            if any(saved[k] != v for k, v in meta.items()):
+                raise ValueError(f'Replay memory at {self.path} was made with {saved}, not {meta}')
+            self.position = saved['position']
+            self.size = saved['size']
+        elif not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        def open_array(name, shape, dtype):
+            return np.lib.format.open_memmap(
+                os.path.join(self.path, name + '.npy'), mode='r+' if reopen else 'w+', dtype=dtype, shape=shape
+            )
+
+        self.states = open_array('states', (self.capacity, state_size), state_dtype)
+        self.next_states = open_array('next_states', (self.capacity, state_size), state_dtype)
+        self.actions = open_array('actions', (self.capacity,), np.uint8)
+        self.rewards = open_array('rewards', (self.capacity,), np.float32)
+        self.dones = open_array('dones', (self.capacity,), np.bool_)
+        self._meta = meta
+        if not reopen:
+            self.flush()
+
+    def flush(self):
+        # write the mapped pages and then where the ring buffer is up to
+        if self.path is None:
+            return
+        for array in (self.states, self.next_states, self.actions, self.rewards, self.dones):
+            array.flush()
+        meta_path = os.path.join(self.path, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({**self._meta, 'position': self.position, 'size': self.size}, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.states.nbytes + self.next_states.nbytes + self.actions.nbytes
+            + self.rewards.nbytes + self.dones.nbytes
+        )
+
+    def push(self, state, action, reward, next_state, done):
+        i = self.position
+        self.states[i] = state
+        self.next_states[i] = next_state
+        self.actions[i] = action if np.ndim(action) == 0 else np.argmax(action)  # one-hot -> index
+        self.rewards[i] = reward
+        self.dones[i] = done
+
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        # actions here are already move indices
+        idx = (self.position + np.arange(len(states))) % self.capacity
+        self.states[idx] = states
+        self.next_states[idx] = next_states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.dones[idx] = dones
+
+        self.position = (self.position + len(states)) % self.capacity
+        self.size = min(self.size + len(states), self.capacity)
+
+    def sample(self, batch_size) -> tuple:
+        if self.size > batch_size:
+            # sorted so reads from a memory-mapped file walk forward through it
+            idx = np.sort(random.sample(range(self.size), batch_size))
+        else:
+            idx = np.arange(self.size)
+        return self._gather(idx)
+
+    def _gather(self, idx) -> tuple:
+        return (
+            torch.from_numpy(self.states[idx]).float(),
+            torch.from_numpy(self.actions[idx]).long(),
+            torch.from_numpy(self.rewards[idx]),
+            torch.from_numpy(self.next_states[idx]).float(),
+            torch.from_numpy(self.dones[idx]),
+        )
+
+
+class SumTree(object):
+    """
+    Array-backed binary tree where each parent holds the sum of its children
+
+    tree[1] is the root and the leaves start at tree[leaves], so both finding the
+    leaf for a running total and updating a leaf touch one node per level.
+    """
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.tree = np.zeros(2 * self.leaves)
+
+    @property
+    def total(self) -> float:
+        return self.tree[1]
+
+    def priorities(self, idx) -> np.ndarray:
+        return self.tree[np.asarray(idx) + self.leaves]
+
+    def set(self, i, priority):
+        node = i + self.leaves
+        change = priority - self.tree[node]
+        while node >= 1:
+            self.tree[node] += change
+            node //= 2
+
+    def update(self, idx, priorities):
+        # every leaf is at the same depth, so parents can be refreshed a level at a time
+        nodes = np.asarray(idx) + self.leaves
+        self.tree[nodes] = priorities
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values) -> np.ndarray:
+        # walk every value down from the root together, going right when it is past the left sum
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.leaves:
+            left = 2 * nodes
+            go_right = values > self.tree[left]
+            values = values - self.tree[left] * go_right
+            nodes = left + go_right
+        return nodes - self.leaves
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    def __init__(self, capacity, state_size, state_dtype=np.uint8, path=None,
+                 alpha=0.6, beta=0.4, beta_increment=0.001, eps=0.01):
+        super().__init__(capacity, state_size, state_dtype, path)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha  # how much prioritisation is used, 0 is uniform
+        self.beta = beta  # importance-sampling correction, annealed up to 1
+        self.beta_increment = beta_increment
+        self.eps = eps  # keeps zero-error transitions sampleable
+        self.max_priority = 1.0
+
+        # priorities are not saved, so reopened transitions all start out equal
+        if self.size:
+            self.tree.update(np.arange(self.size), np.ones(self.size))
+
+    def push(self, state, action, reward, next_state, done):
+        # new transitions get the largest priority so far, so each is seen at least once
+        self.tree.set(self.position, self.max_priority ** self.alpha)
+        super().push(state, action, reward, next_state, done)
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        idx = (self.position + np.arange(len(states))) % self.capacity
+        self.tree.update(idx, np.full(len(idx), self.max_priority ** self.alpha))
+        super().push_batch(states, actions, rewards, next_states, dones)
+
+    def sample(self, batch_size) -> tuple:
+        # one draw from each of batch_size equal slices of the total priority
+        n = min(batch_size, self.size)
+        values = (np.arange(n) + np.random.random(n)) * (self.tree.total / n)
+        idx = np.minimum(self.tree.find(values), self.size - 1)
+
+        probs = self.tree.priorities(idx) / self.tree.total
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        return self._gather(idx) + (torch.from_numpy(weights).float(), idx)
+
+    def update_priorities(self, idx, td_errors):
+        priorities = np.abs(np.asarray(td_errors, dtype=np.float64)) + self.eps
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(idx, priorities ** self.alpha)
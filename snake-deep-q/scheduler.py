@@ -0,0 +1,163 @@
+"""
+When the training loop takes optimiser steps
+
+The original loop takes a batch-of-one step on every transition
+(train_short_memory) and one minibatch step from replay memory when a game
+ends. That is PerStepSchedule and stays the default; the others drop the
+batch-of-one steps and only take minibatch steps:
+
+    EveryKSchedule(b, k, n)       n minibatches of size b every k env steps
+    ReplayRatioSchedule(b, ratio) as many minibatches of size b as keeps
+                                  ratio transitions replayed per new one
+    EpisodeEndSchedule(b, n)      n minibatches of size b when a game ends
+
+The loop asks after each step and each game how many minibatch updates are
+due, and trains on minibatches of the schedule's batch_size. The schedule
+keeps count so it can report updates/sec and the replay ratio it actually
+achieved. make_schedule gives the step-driven schedules (every_k and
+replay_ratio) their own, smaller, update_batch_size, since they update far
+more often than once a game.
+"""
+
+import time
+
+
+class PerStepSchedule(object):
+    name = 'per_step'
+    short_memory = True  # also train on each transition as it happens
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.steps = 0
+        self.updates = 0  # optimiser steps, batch-of-one ones included
+        self.replayed = 0  # transitions trained on
+        self.started = time.perf_counter()
+
+    def step(self) -> int:
+        """
+        Count an env step, returning the minibatch updates due now
+        """
+        self.steps += 1
+        n = self._due_after_step()
+        if self.short_memory:
+            self.updates += 1
+            self.replayed += 1
+        self.updates += n
+        self.replayed += n * self.batch_size
+        return n
+
+    def end_episode(self) -> int:
+        """
+        Count the end of a game, returning the minibatch updates due now
+        """
+        n = self._due_after_episode()
+        self.updates += n
+        self.replayed += n * self.batch_size
+        return n
+
+    def _due_after_step(self) -> int:
+        return 0
+
+    def _due_after_episode(self) -> int:
+        return 1
+
+    def updates_per_sec(self) -> float:
+        return self.updates / (time.perf_counter() - self.started)
+
+    def replay_ratio(self) -> float:
+        # counts a full batch even while memory holds fewer transitions
+        return self.replayed / max(self.steps, 1)
+
+    def describe(self) -> str:
+        return f'a batch-of-one update every step and a batch of {self.batch_size} every game'
+
+    def report(self) -> str:
+        return (
+            f'Updates/sec {self.updates_per_sec():.1f} Replay ratio {self.replay_ratio():.2f} '
+            f'({self.updates} updates over {self.steps} steps)'
+        )
+
+
+class EveryKSchedule(PerStepSchedule):
+    name = 'every_k'
+    short_memory = False
+
+    def __init__(self, batch_size, every=4, n_updates=1):
+        super().__init__(batch_size)
+        self.every = every
+        self.n_updates = n_updates
+
+    def _due_after_step(self) -> int:
+        return self.n_updates if self.steps % self.every == 0 else 0
+
+    def _due_after_episode(self) -> int:
+        return 0
+
+    def describe(self) -> str:
+        return f'{self.n_updates} batch(es) of {self.batch_size} every {self.every} steps'
+
+
+class ReplayRatioSchedule(PerStepSchedule):
+    name = 'replay_ratio'
+    short_memory = False
+
+    def __init__(self, batch_size, ratio=8):
+        super().__init__(batch_size)
+        self.ratio = ratio  # transitions replayed per env step
+        self._credit = 0.0  # fractions of a minibatch owed
+
+    def _due_after_step(self) -> int:
+        self._credit += self.ratio / self.batch_size
+        n = int(self._credit)
+        self._credit -= n
+        return n
+
+    def _due_after_episode(self) -> int:
+        return 0
+
+    def describe(self) -> str:
+        return f'batches of {self.batch_size} to replay {self.ratio} transitions per step'
+
+
+class EpisodeEndSchedule(PerStepSchedule):
+    name = 'episode_end'
+    short_memory = False
+
+    def __init__(self, batch_size, n_updates=1):
+        super().__init__(batch_size)
+        self.n_updates = n_updates
+
+    def _due_after_episode(self) -> int:
+        return self.n_updates
+
+    def describe(self) -> str:
+        return f'{self.n_updates} batch(es) of {self.batch_size} every game'
+
+
+def make_schedule(name, batch_size, update_batch_size=32, every=4, ratio=8, episode_updates=1) -> PerStepSchedule:
+    # batch_size for the once-a-game minibatches, update_batch_size for the step-driven ones
+    if name == 'per_step':
+        return PerStepSchedule(batch_size)
+    if name == 'every_k':
+        return EveryKSchedule(update_batch_size, every)
+    if name == 'replay_ratio':
+        return ReplayRatioSchedule(update_batch_size, ratio)
+    if name == 'episode_end':
+        return EpisodeEndSchedule(batch_size, episode_updates)
+    raise ValueError(f'Unknown update schedule {name!r}, not per_step, every_k, replay_ratio or episode_end')
+
+
+if __name__ == '__main__':
+    # minibatch updates handed out over 10 games of 250 steps
+    for schedule in (
+        make_schedule('per_step', 1000),
+        make_schedule('every_k', 1000, 32, every=4),
+        make_schedule('replay_ratio', 1000, 32, ratio=8),
+        make_schedule('episode_end', 1000, episode_updates=4),
+    ):
+        minibatches = 0
+        for _ in range(10):
+            for _ in range(250):
+                minibatches += schedule.step()
+            minibatches += schedule.end_episode()
+        print(f'{schedule.name:<14}{minibatches:>5} minibatches  {schedule.describe()}: {schedule.report()}')
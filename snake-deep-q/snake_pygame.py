@@ -7,10 +7,9 @@ import pygame
 import random
 import numpy as np
 from enum import Enum
-from collections import namedtuple
+from collections import namedtuple, deque, Counter
 
-pygame.init()
-font = pygame.font.Font('arial.ttf', 25)
+font = None  # loaded along with the first display, so a headless import starts no part of pygame
 
 
 class Direction(Enum):
@@ -22,6 +21,13 @@ class Direction(Enum):
 
 Point = namedtuple('Point', 'x, y')
 
+# everything play_step depends on, in immutable pieces so copying one is free,
+# and the length of the action log when it was taken (n_actions);
+# see SnakeGameAI.snapshot/restore and step
+SnakeState = namedtuple(
+    'SnakeState', 'w, h, snake, direction, food, score, frame_iteration, rng_state, free, n_actions'
+)
+
 # rgb colors
 WHITE = (255, 255, 255)
 RED = (200, 0, 0)
@@ -30,37 +36,103 @@ BLUE2 = (0, 100, 255)
 BLACK = (0, 0, 0)
 
 BLOCK_SIZE = 20
+CLOCK_WISE = (Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP)
+TURNS = (0, 1, -1)  # [straight, right, left]
+OFFSETS = {
+    Direction.RIGHT: (BLOCK_SIZE, 0),
+    Direction.DOWN: (0, BLOCK_SIZE),
+    Direction.LEFT: (-BLOCK_SIZE, 0),
+    Direction.UP: (0, -BLOCK_SIZE),
+}
+FOOD_TRIES = 32  # random cells step tries before listing the free cells
 # SPEED = 20  # for human
 SPEED = 50  # for bot
 
 
 class SnakeGameAI:
 
-    def __init__(self, w=640, h=480):
+    def __init__(self, w=640, h=480, headless=False, render_every=0, draw_every=1):
         self.w = w
         self.h = h
-        # init display
-        self.display = pygame.display.set_mode((self.w, self.h))
-        pygame.display.set_caption('Snake')
-        self.clock = pygame.time.Clock()
+        # headless skips the display, event polling, font rendering and clock entirely;
+        # with render_every > 0 a headless game still shows every Nth episode
+        self.headless = headless
+        self.render_every = render_every
+        self.draw_every = draw_every  # when rendering, only draw (and tick the clock) every Nth frame
+        self.episode = -1  # bumped to 0 by the first reset
+        self.display = None
+        self.clock = None
+        if not self.headless:
+            self._init_display()
+
+        # cells changed since the last draw (None when not rendering), so only they are redrawn
+        self._dirty = None
+        self._redraw_all = True
+        self._drawn_food = None
+        self._drawn_score = None
+        self._score_rect = pygame.Rect(0, 0, 0, 0)
 
         self.direction = 0
         self.head = None
-        self.snake = []
+        self.snake = deque()
+        self._occupied = Counter()  # point -> number of body segments on it
+        self._free = []  # every board cell no segment is on, in no particular order
+        self._free_index = {}  # point -> its position in _free
+        self._cells = [
+            Point(x, y)
+            for y in range(0, self.h - BLOCK_SIZE + 1, BLOCK_SIZE)
+            for x in range(0, self.w - BLOCK_SIZE + 1, BLOCK_SIZE)
+        ]
+        self._cell_index = {pt: i for i, pt in enumerate(self._cells)}
         self.score = 0
         self.food = None
         self.frame_iteration = 0
 
+        # each episode draws its food from its own generator, so a seed and the
+        # actions taken (one byte each, see episode_log.py) replay it exactly
+        self.seed = None
+        self.rng = random.Random()
+        self.actions = bytearray()
+
         self.reset()
 
-    def reset(self):
+    def _init_display(self):
+        global font
+        pygame.init()
+        if font is None:
+            font = pygame.font.Font('arial.ttf', 25)
+        self.display = pygame.display.set_mode((self.w, self.h))
+        pygame.display.set_caption('Snake')
+        self.clock = pygame.time.Clock()
+
+    @property
+    def rendering(self) -> bool:
+        if not self.headless:
+            return True
+        return self.render_every > 0 and self.episode % self.render_every == 0
+
+    def reset(self, seed=None):
         # init game state
+        self.episode += 1
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.rng.seed(self.seed)
+        self.actions = bytearray()
+        if self.rendering and self.display is None:
+            self._init_display()
+
         self.direction = Direction.RIGHT
 
         self.head = Point(self.w / 2, self.h / 2)
-        self.snake = [self.head,
-                      Point(self.head.x - BLOCK_SIZE, self.head.y),
-                      Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)]
+        self.snake = deque([self.head,
+                            Point(self.head.x - BLOCK_SIZE, self.head.y),
+                            Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)])
+        self._occupied = Counter(self.snake)
+        self._free = self._cells.copy()
+        self._free_index = self._cell_index.copy()
+        for pt in self.snake:
+            self._take_free(pt)
+        self._dirty = set() if self.rendering else None
+        self._redraw_all = True
 
         self.score = 0
         self.food = None
@@ -68,24 +140,64 @@ class SnakeGameAI:
         self._place_food()
 
     def _place_food(self):
-        x = random.randint(0, (self.w - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        y = random.randint(0, (self.h - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        self.food = Point(x, y)
-        if self.food in self.snake:
-            self._place_food()
+        # uniform over the free cells, however full the board is
+        if not self._free:
+            return  # the snake fills the board, so its next move ends the game
+        self.food = self._free[self.rng.randrange(len(self._free))]
+
+    def snapshot(self) -> SnakeState:
+        """
+        The game state as a SnakeState, for step or a later restore
+        """
+        return SnakeState(
+            self.w, self.h, tuple(self.snake), self.direction, self.food, self.score, self.frame_iteration,
+            self.rng.getstate(), tuple(self._free), len(self.actions)
+        )
+
+    def restore(self, state):
+        """
+        Put the game back in a SnakeState, cutting the action log back to its length
+        at the snapshot so a recorded episode still replays from its seed
+
+        A state made by step is not in the log at all, and step places food
+        differently, so a game restored from one no longer replays from its seed:
+        don't record an episode restored from such a state.
+        """
+        if (state.w, state.h) != (self.w, self.h):
+            raise ValueError(f'State is for a {state.w}x{state.h} board, not {self.w}x{self.h}')
+        self.snake = deque(state.snake)
+        self.head = state.snake[0]
+        self.direction = state.direction
+        self.food = state.food
+        self.score = state.score
+        self.frame_iteration = state.frame_iteration
+        self.rng.setstate(state.rng_state)
+        del self.actions[state.n_actions:]  # the moves of the discarded branch
+
+        self._occupied = Counter(self.snake)
+        if state.free is None:
+            # a state from step: same free cells, but not in the order play_step would have left them
+            self._free = [pt for pt in self._cells if pt not in self._occupied]
+        else:
+            self._free = list(state.free)
+        self._free_index = {pt: i for i, pt in enumerate(self._free)}
+        if self._dirty is not None:
+            self._redraw_all = True
 
     def play_step(self, action) -> (int, bool, int):
         self.frame_iteration += 1
 
         # 1. collect user input
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                quit()
+        drawing = self.rendering and self.frame_iteration % self.draw_every == 0
+        if drawing:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    quit()
 
         # 2. move
         self._move(action)  # update the head
-        self.snake.insert(0, self.head)
+        self._push_head(self.head)
 
         # 3. check if game over
         reward = 0
@@ -101,11 +213,12 @@ class SnakeGameAI:
             reward = 10
             self._place_food()
         else:
-            self.snake.pop()
+            self._pop_tail()
 
         # 5. update ui and clock
-        self._update_ui()
-        self.clock.tick(SPEED)
+        if drawing:
+            self._update_ui()
+            self.clock.tick(SPEED)
         # 6. return game over and score
         return reward, game_over, self.score
 
@@ -115,21 +228,85 @@ class SnakeGameAI:
         # hits boundary
         if pt.x > self.w - BLOCK_SIZE or pt.x < 0 or pt.y > self.h - BLOCK_SIZE or pt.y < 0:
             return True
-        # hits itself
-        return pt in self.snake[1:]
+        # hits itself (the head's own cell only counts if another segment is also on it)
+        return self._occupied[pt] > (pt == self.snake[0])
+
+    def _push_head(self, pt):
+        self.snake.appendleft(pt)
+        self._occupied[pt] += 1
+        self._take_free(pt)
+        if self._dirty is not None:
+            self._dirty.add(pt)
+
+    def _take_free(self, pt):
+        if pt in self._free_index:
+            # swap the last free cell into its place
+            i = self._free_index.pop(pt)
+            last = self._free.pop()
+            if last != pt:
+                self._free[i] = last
+                self._free_index[last] = i
+
+    def _pop_tail(self):
+        tail = self.snake.pop()
+        self._occupied[tail] -= 1
+        if not self._occupied[tail]:
+            del self._occupied[tail]
+            self._free_index[tail] = len(self._free)
+            self._free.append(tail)
+        if self._dirty is not None:
+            self._dirty.add(tail)
 
     def _update_ui(self):
-        self.display.fill(BLACK)
-
-        for pt in self.snake:
-            pygame.draw.rect(self.display, BLUE1, pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE))
+        if self._redraw_all:
+            self.display.fill(BLACK)
+            for pt in self.snake:
+                self._draw_cell(pt)
+            self._draw_cell(self.food)
+            self._draw_score()
+            pygame.display.flip()
+
+            self._redraw_all = False
+            self._dirty.clear()
+            self._drawn_food = self.food
+            return
+
+        # only the new head, the vacated tail, the moved food and changed text
+        rects = [self._draw_cell(pt) for pt in self._dirty]
+        if self.food != self._drawn_food:
+            rects.append(self._draw_cell(self.food))
+            self._drawn_food = self.food
+        if self.score != self._drawn_score or self._score_rect.collidelist(rects) != -1:
+            rects.append(self._draw_score())
+        self._dirty.clear()
+        pygame.display.update(rects)
+
+    def _draw_cell(self, pt) -> pygame.Rect:
+        rect = pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE)
+        if pt in self._occupied:
+            pygame.draw.rect(self.display, BLUE1, rect)
             pygame.draw.rect(self.display, BLUE2, pygame.Rect(pt.x + 4, pt.y + 4, 12, 12))
+        elif pt == self.food:
+            pygame.draw.rect(self.display, RED, rect)
+        else:
+            pygame.draw.rect(self.display, BLACK, rect)
+        return rect
 
-        pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
-
+    def _draw_score(self) -> pygame.Rect:
+        # the text sits on top of the board, so redraw the cells under the old and new text first
         text = font.render(f"Score: {str(self.score)}", True, WHITE)
+        area = self._score_rect.union(text.get_rect())
+        self.display.fill(BLACK, area)
+        for x in range(0, area.right, BLOCK_SIZE):
+            for y in range(0, area.bottom, BLOCK_SIZE):
+                pt = Point(x, y)
+                if pt in self._occupied or pt == self.food:
+                    self._draw_cell(pt)
         self.display.blit(text, [0, 0])
-        pygame.display.flip()
+
+        self._score_rect = text.get_rect()
+        self._drawn_score = self.score
+        return area
 
     def _move(self, action):
         # [stright, right, left]
@@ -138,12 +315,15 @@ class SnakeGameAI:
         idx = clock_wise.index(self.direction)
         if np.array_equal(action, [1, 0, 0]):
             new_dir = clock_wise[idx]  # no change
+            self.actions.append(0)
         elif np.array_equal(action, [0, 1, 0]):
             next_idx = (idx + 1) % 4
             new_dir = clock_wise[next_idx]  # right turn: r -> d -> l -> u
+            self.actions.append(1)
         else:  # [0, 0, 1]
             next_idx = (idx - 1) % 4
             new_dir = clock_wise[next_idx]  # left turn: r -> u -> l -> d
+            self.actions.append(2)
         self.direction = new_dir
 
         x = self.head.x
@@ -158,3 +338,63 @@ class SnakeGameAI:
             y -= BLOCK_SIZE
 
         self.head = Point(x, y)
+
+
+def step(state, action) -> (SnakeState, int, bool, int):
+    """
+    play_step on a SnakeState instead of a game, returning the next state with the
+    reward, game over and score, and leaving the given state as it was
+
+    action is a move index or one-hot [straight, right, left]. Everything follows
+    play_step except where new food goes: it is still drawn from the state's
+    generator and uniform over the free cells, but not from the same draws.
+    """
+    if not isinstance(action, (int, np.integer)):
+        action = int(np.argmax(action))
+    frame_iteration = state.frame_iteration + 1
+
+    # 1. move
+    direction = CLOCK_WISE[(CLOCK_WISE.index(state.direction) + TURNS[action]) % 4]
+    dx, dy = OFFSETS[direction]
+    head = Point(state.snake[0].x + dx, state.snake[0].y + dy)
+    snake = (head,) + state.snake
+
+    # 2. check if game over (the tail has not moved yet, as in play_step)
+    if (head.x > state.w - BLOCK_SIZE or head.x < 0 or head.y > state.h - BLOCK_SIZE or head.y < 0
+            or head in state.snake or frame_iteration > 100 * len(snake)):
+        return state._replace(
+            snake=snake, direction=direction, frame_iteration=frame_iteration, free=None
+        ), -10, True, state.score
+
+    # 3. place new food or just move
+    if head == state.food:
+        food, rng_state = _step_food(state.w, state.h, snake, state.food, state.rng_state)
+        return SnakeState(
+            state.w, state.h, snake, direction, food, state.score + 1, frame_iteration, rng_state, None,
+            state.n_actions
+        ), 10, False, state.score + 1
+    return state._replace(
+        snake=snake[:-1], direction=direction, frame_iteration=frame_iteration, free=None
+    ), 0, False, state.score
+
+
+def _step_food(w, h, snake, food, rng_state) -> (Point, tuple):
+    rng = random.Random()
+    rng.setstate(rng_state)
+    occupied = set(snake)
+    columns, rows = w // BLOCK_SIZE, h // BLOCK_SIZE
+
+    # nearly always a random cell is free within a few tries...
+    for _ in range(FOOD_TRIES):
+        pt = Point(rng.randrange(columns) * BLOCK_SIZE, rng.randrange(rows) * BLOCK_SIZE)
+        if pt not in occupied:
+            return pt, rng.getstate()
+
+    # ...but on a nearly full board pick from a list of them instead
+    free = [
+        Point(x * BLOCK_SIZE, y * BLOCK_SIZE) for y in range(rows) for x in range(columns)
+        if Point(x * BLOCK_SIZE, y * BLOCK_SIZE) not in occupied
+    ]
+    if free:
+        food = free[rng.randrange(len(free))]
+    return food, rng.getstate()  # with no free cell the food stays put, as in _place_food
@@ -0,0 +1,361 @@
+"""
+Hyperparameter sweeps for the snake agent
+
+Run from this folder:
+    python sweep.py                                   # grid over SPACE, one trial per core
+    python sweep.py --random 40 --max-steps 200000    # 40 random configs instead
+    python sweep.py --space space.json --workers 8 --max-seconds 1800
+    python sweep.py --report --top 10                 # just print the best trials so far
+    python sweep.py --random 40 --max-steps 200000    # again, to resume the same sweep after a crash
+
+A search space maps Agent keyword arguments, and the update schedule settings
+in SCHEDULE_KEYS, to a list of values (grid or random search) or, for random
+search only, to {"uniform": [low, high]} or {"loguniform": [low, high]};
+anything left out keeps its default in agent.py. Random draws for settings
+whose default is an int are rounded.
+
+Every trial trains a headless agent from its own seed until it runs out of
+steps or time, taking its updates on the same schedule train() would. Each game
+and a running mean score every EVAL_EVERY games go into an sqlite table as they
+happen, so a sweep can be watched (or queried) while it runs.
+
+Trials belong to a sweep, named by --sweep or by default after the search space,
+--random and --seed. Running the same sweep again with the same --db resumes it:
+finished and stopped trials are skipped, and any queued, running or failed ones
+are run again from the start under their old trial numbers. A trial stops early
+under the median stopping rule (Golovin et al., 2017): once past GRACE_GAMES, if
+its best running mean so far is below the median of the other trials' running
+means in the same sweep at the same game, it is not worth the rest of its budget.
+"""
+
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import hashlib
+import inspect
+import itertools
+import json
+import math
+import random
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
+
+SPACE = {
+    'lr': [0.0005, 0.001, 0.002],
+    'batch_size': [256, 1000],
+    'gamma': [0.9, 0.95],
+    'hidden_size': [128, 256],
+    'explore_games': [40, 80, 160],
+}
+MAX_STEPS = 100000  # env steps per trial
+MAX_SECONDS = 900  # wall-clock seconds per trial
+EVAL_EVERY = 10  # games between running-mean checks
+WINDOW = 50  # games in the running mean score
+GRACE_GAMES = 100  # games every trial plays before it can be stopped
+MIN_TRIALS = 3  # other trials needed at a game count before stopping on their median
+# config keys that go to make_schedule rather than Agent, each defaulting to its upper-case constant in agent.py
+SCHEDULE_KEYS = ('update_schedule', 'update_batch_size', 'update_every', 'replay_ratio', 'episode_updates')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    trial INTEGER PRIMARY KEY,
+    sweep TEXT NOT NULL DEFAULT '',
+    position INTEGER,  -- the config's place in its sweep
+    config TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    status TEXT NOT NULL,  -- queued, running, done, stopped or failed
+    games INTEGER DEFAULT 0,
+    steps INTEGER DEFAULT 0,
+    seconds REAL DEFAULT 0,
+    mean_score REAL,  -- over the last WINDOW games, the sweep's objective
+    record INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS games (
+    trial INTEGER NOT NULL,
+    game INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    steps INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS progress (
+    trial INTEGER NOT NULL,
+    game INTEGER NOT NULL,
+    mean_score REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS progress_game ON progress (game);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS trials_sweep ON trials (sweep, position);
+"""
+
+
+def connect(path) -> sqlite3.Connection:
+    db = sqlite3.connect(path, timeout=60)
+    db.execute('PRAGMA journal_mode=WAL')  # workers write while others read
+    db.executescript(SCHEMA)
+    # files from before trials had a sweep
+    columns = {row[1] for row in db.execute('PRAGMA table_info(trials)')}
+    for column, kind in (('sweep', "TEXT NOT NULL DEFAULT ''"), ('position', 'INTEGER')):
+        if column not in columns:
+            db.execute(f'ALTER TABLE trials ADD COLUMN {column} {kind}')
+    db.executescript(INDEXES)
+    return db
+
+
+def agent_defaults() -> dict:
+    # imported here so spawned workers, which import this module, only load agent.py in run_trial
+    import agent
+    defaults = {
+        name: parameter.default for name, parameter in inspect.signature(agent.Agent).parameters.items()
+        if parameter.default is not inspect.Parameter.empty
+    }
+    defaults.update({key: getattr(agent, key.upper()) for key in SCHEDULE_KEYS})
+    return defaults
+
+
+def grid_configs(space) -> list:
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_configs(space, n, rng, integers=()) -> list:
+    # integers names the settings whose ranges are drawn as ints
+    def draw(name, values):
+        if isinstance(values, list):
+            return rng.choice(values)
+        if 'loguniform' in values:
+            low, high = values['loguniform']
+            value = math.exp(rng.uniform(math.log(low), math.log(high)))
+        else:
+            low, high = values['uniform']
+            value = rng.uniform(low, high)
+        return round(value) if name in integers else value
+    return [{name: draw(name, values) for name, values in space.items()} for _ in range(n)]
+
+
+def sweep_name(space, n_random, seed) -> str:
+    # the same search always gets the same name, so running it again resumes it
+    search = json.dumps({'space': space, 'random': n_random, 'seed': seed}, sort_keys=True)
+    return f"{'random' if n_random else 'grid'}-{hashlib.sha1(search.encode()).hexdigest()[:8]}"
+
+
+def should_stop(db, sweep, trial, game, best_mean) -> bool:
+    if game < GRACE_GAMES:
+        return False
+    others = [
+        row[0] for row in db.execute(
+            'SELECT progress.mean_score FROM progress JOIN trials ON trials.trial = progress.trial '
+            'WHERE trials.sweep = ? AND progress.game = ? AND progress.trial != ?',
+            (sweep, game, trial)
+        )
+    ]
+    if len(others) < MIN_TRIALS:
+        return False
+    others.sort()
+    mid = len(others) // 2
+    median = others[mid] if len(others) % 2 else (others[mid - 1] + others[mid]) / 2
+    return best_mean < median
+
+
+def run_trial(db_path, sweep, trial, config, seed, max_steps, max_seconds) -> dict:
+    # imported here so the sweep process only loads torch and pygame for agent_defaults
+    import numpy as np
+    import torch
+    from snake_pygame import SnakeGameAI
+    from agent import Agent
+    from scheduler import make_schedule
+
+    torch.set_num_threads(1)  # one core per trial
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    db = connect(db_path)
+    with db:
+        db.execute("UPDATE trials SET status = 'running' WHERE trial = ?", (trial,))
+    agent = None
+    scores = []
+    games = []
+    steps = 0
+    game_steps = 0
+    record = 0
+    best_mean = -math.inf
+    status = 'done'
+    start = time.perf_counter()
+    try:
+        settings = {**agent_defaults(), **config}
+        agent = Agent(**{name: value for name, value in config.items() if name not in SCHEDULE_KEYS})
+        schedule = make_schedule(
+            settings['update_schedule'], agent.batch_size, settings['update_batch_size'], settings['update_every'],
+            settings['replay_ratio'], settings['episode_updates']
+        )
+        game = SnakeGameAI(headless=True)
+        while steps < max_steps and time.perf_counter() - start < max_seconds:
+            # the train() loop of agent.py, without display, plots or checkpoints
+            state_old = agent.get_state(game)
+            final_move = agent.get_action(state_old)
+            reward, done, score = game.play_step(final_move)
+            state_new = agent.get_state(game)
+            if schedule.short_memory:
+                agent.train_short_memory(state_old, final_move, reward, state_new, done)
+            agent.remember(state_old, final_move, reward, state_new, done)
+            for _ in range(schedule.step()):
+                agent.train_long_memory(schedule.batch_size)
+            steps += 1
+            game_steps += 1
+
+            if done:
+                game.reset()
+                agent.n_games += 1
+                for _ in range(schedule.end_episode()):
+                    agent.train_long_memory(schedule.batch_size)
+                record = max(record, score)
+                scores.append(score)
+                games.append((trial, agent.n_games, score, game_steps))
+                game_steps = 0
+
+                if agent.n_games % EVAL_EVERY == 0:
+                    mean_score = sum(scores[-WINDOW:]) / len(scores[-WINDOW:])
+                    best_mean = max(best_mean, mean_score)
+                    with db:
+                        db.executemany('INSERT INTO games VALUES (?, ?, ?, ?)', games)
+                        db.execute('INSERT INTO progress VALUES (?, ?, ?)', (trial, agent.n_games, mean_score))
+                        db.execute(
+                            'UPDATE trials SET games = ?, steps = ?, seconds = ?, mean_score = ?, record = ? '
+                            'WHERE trial = ?',
+                            (agent.n_games, steps, time.perf_counter() - start, mean_score, record, trial)
+                        )
+                    games = []
+                    if should_stop(db, sweep, trial, agent.n_games, best_mean):
+                        status = 'stopped'
+                        break
+    except Exception:
+        status = 'failed'
+        raise
+    finally:
+        n_games = agent.n_games if agent is not None else 0
+        mean_score = sum(scores[-WINDOW:]) / len(scores[-WINDOW:]) if scores else None
+        with db:
+            db.executemany('INSERT INTO games VALUES (?, ?, ?, ?)', games)
+            db.execute(
+                'UPDATE trials SET status = ?, games = ?, steps = ?, seconds = ?, mean_score = ?, record = ? '
+                'WHERE trial = ?',
+                (status, n_games, steps, time.perf_counter() - start, mean_score, record, trial)
+            )
+        db.close()
+    return {'trial': trial, 'status': status, 'games': n_games, 'mean_score': mean_score, 'record': record}
+
+
+def print_top(db, n, sweep=None):
+    # the best trials of one sweep, or of every sweep in the file
+    rows = db.execute(
+        'SELECT trial, sweep, status, games, mean_score, record, config FROM trials '
+        'WHERE mean_score IS NOT NULL AND (? IS NULL OR sweep = ?) ORDER BY mean_score DESC LIMIT ?',
+        (sweep, sweep, n)
+    )
+    for trial, sweep, status, games, mean_score, record, config in rows:
+        print(
+            f"Trial {trial:<4} {sweep:<16} {status:<8} Games {games:<6} Mean {mean_score:7.2f} Record {record:<4} "
+            f"{config}"
+        )
+
+
+def queue_trials(db, sweep, configs, seed) -> list:
+    """
+    (trial, config, seed) for every config of the sweep still to run, reusing the
+    trials a previous run of the sweep left unfinished
+    """
+    trials = []
+    with db:
+        for position, config in enumerate(configs):
+            row = db.execute(
+                'SELECT trial, config, seed, status FROM trials WHERE sweep = ? AND position = ?', (sweep, position)
+            ).fetchone()
+            if row is None:
+                trial = db.execute('SELECT COALESCE(MAX(trial), -1) + 1 FROM trials').fetchone()[0]
+                db.execute(
+                    'INSERT INTO trials (trial, sweep, position, config, seed, status) VALUES (?, ?, ?, ?, ?, ?)',
+                    (trial, sweep, position, json.dumps(config), seed + position, 'queued')
+                )
+                trials.append((trial, config, seed + position))
+                continue
+
+            trial, saved_config, trial_seed, status = row
+            if json.loads(saved_config) != config:
+                raise ValueError(f'Trial {trial} of sweep {sweep} was {saved_config}, not {json.dumps(config)}')
+            if status in ('done', 'stopped'):
+                continue
+            # start it again from scratch, so its old games don't count twice
+            db.execute('DELETE FROM games WHERE trial = ?', (trial,))
+            db.execute('DELETE FROM progress WHERE trial = ?', (trial,))
+            db.execute(
+                "UPDATE trials SET status = 'queued', games = 0, steps = 0, seconds = 0, mean_score = NULL, "
+                'record = 0 WHERE trial = ?', (trial,)
+            )
+            trials.append((trial, config, trial_seed))
+    return trials
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter sweep for the snake agent')
+    parser.add_argument('--db', default='sweep.sqlite', help='sqlite file the results stream into')
+    parser.add_argument('--sweep', help='name of the sweep to run or resume, by default one made from the search')
+    parser.add_argument('--space', help='JSON search space, instead of SPACE')
+    parser.add_argument('--random', type=int, default=0, help='random search with this many trials, instead of a grid')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='trials run at once')
+    parser.add_argument('--max-steps', type=int, default=MAX_STEPS, help='env steps per trial')
+    parser.add_argument('--max-seconds', type=float, default=MAX_SECONDS, help='wall-clock seconds per trial')
+    parser.add_argument('--seed', type=int, default=0, help="the sweep's i-th trial is seeded with seed + i")
+    parser.add_argument('--top', type=int, default=10, help='best trials to print at the end')
+    parser.add_argument('--report', action='store_true', help='only print the best trials in --db (or --sweep)')
+    args = parser.parse_args(argv)
+
+    db = connect(args.db)
+    if args.report:
+        print_top(db, args.top, args.sweep)
+        return
+
+    space = SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    if args.random:
+        defaults = agent_defaults()
+        integers = {
+            name for name, value in defaults.items() if isinstance(value, int) and not isinstance(value, bool)
+        }
+        configs = random_configs(space, args.random, random.Random(args.seed), integers)
+    else:
+        configs = grid_configs(space)
+    sweep = args.sweep or sweep_name(space, args.random, args.seed)
+
+    trials = queue_trials(db, sweep, configs, args.seed)
+    print(
+        'Running', len(trials), 'of the', len(configs), 'trials of sweep', sweep, 'on', args.workers,
+        'workers into', args.db
+    )
+
+    # spawn, so each worker starts without the parent's state
+    with ProcessPoolExecutor(args.workers, mp_context=mp.get_context('spawn')) as pool:
+        futures = [
+            pool.submit(run_trial, args.db, sweep, trial, config, seed, args.max_steps, args.max_seconds)
+            for trial, config, seed in trials
+        ]
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print('Trial failed:', repr(e))
+                continue
+            print(
+                'Trial', result['trial'], result['status'],
+                'Games', result['games'], 'Mean', result['mean_score'], 'Record', result['record']
+            )
+
+    print_top(db, args.top, sweep)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+N snake games held as NumPy arrays and stepped together
+
+Each board lives in cell coordinates (pixel / BLOCK_SIZE) rather than a list of
+Points. The body is an occupancy grid of remaining lifetimes: the head holds the
+snake length and the tail holds 1, so a move is a decrement of the whole grid and
+an eat is skipping that decrement. Rewards, game over and scores follow
+SnakeGameAI.play_step exactly.
+"""
+
+import numpy as np
+from snake_pygame import BLOCK_SIZE
+
+# clockwise like SnakeGameAI._move: right, down, left, up
+DX = np.array([1, 0, -1, 0])
+DY = np.array([0, 1, 0, -1])
+TURNS = np.array([0, 1, -1])  # [straight, right, left]
+
+
+class VecSnakeEnv(object):
+    def __init__(self, n_envs, w=640, h=480, seed=None):
+        self.n_envs = n_envs
+        self.grid_w = w // BLOCK_SIZE
+        self.grid_h = h // BLOCK_SIZE
+        self.rng = np.random.default_rng(seed)
+
+        self.heads = np.zeros((n_envs, 2), dtype=np.int64)  # (x, y)
+        self.directions = np.zeros(n_envs, dtype=np.int64)  # index into DX/DY
+        self.food = np.zeros((n_envs, 2), dtype=np.int64)
+        self.body = np.zeros((n_envs, self.grid_h, self.grid_w), dtype=np.int32)
+        self.lengths = np.zeros(n_envs, dtype=np.int64)
+        self.frame_iterations = np.zeros(n_envs, dtype=np.int64)
+        self.scores = np.zeros(n_envs, dtype=np.int64)
+
+        self.reset()
+
+    def reset(self, idx=None):
+        if idx is None:
+            idx = np.arange(self.n_envs)
+        if len(idx) == 0:
+            return
+
+        # same start as SnakeGameAI.reset: heading right from the middle, 3 long
+        x = (self.grid_w * BLOCK_SIZE // 2) // BLOCK_SIZE
+        y = (self.grid_h * BLOCK_SIZE // 2) // BLOCK_SIZE
+        self.body[idx] = 0
+        self.body[idx, y, x] = 3
+        self.body[idx, y, x - 1] = 2
+        self.body[idx, y, x - 2] = 1
+        self.heads[idx] = (x, y)
+        self.directions[idx] = 0
+        self.lengths[idx] = 3
+        self.frame_iterations[idx] = 0
+        self.scores[idx] = 0
+        self._place_food(idx)
+
+    def _place_food(self, idx):
+        # uniform over the free cells of each board: argmax of random keys on free cells only
+        if len(idx) == 0:
+            return
+        free = (self.body[idx] == 0).reshape(len(idx), -1)
+        keys = self.rng.random(free.shape)
+        keys[~free] = -1
+        cells = np.argmax(keys, axis=1)
+        self.food[idx, 0] = cells % self.grid_w
+        self.food[idx, 1] = cells // self.grid_w
+
+    def step(self, actions) -> (np.ndarray, np.ndarray, np.ndarray):
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            actions = np.argmax(actions, axis=1)  # one-hot [straight, right, left] -> index
+
+        self.frame_iterations += 1
+
+        # 1. move
+        self.directions = (self.directions + TURNS[actions]) % 4
+        new_x = self.heads[:, 0] + DX[self.directions]
+        new_y = self.heads[:, 1] + DY[self.directions]
+
+        # 2. check if game over (the tail has not moved yet, as in play_step)
+        off_board = (new_x < 0) | (new_x >= self.grid_w) | (new_y < 0) | (new_y >= self.grid_h)
+        envs = np.arange(self.n_envs)
+        cx = np.clip(new_x, 0, self.grid_w - 1)
+        cy = np.clip(new_y, 0, self.grid_h - 1)
+        hit_self = ~off_board & (self.body[envs, cy, cx] > 0)
+        timed_out = self.frame_iterations > 100 * (self.lengths + 1)
+        dones = off_board | hit_self | timed_out
+
+        # 3. place new food or just move
+        alive = ~dones
+        ate = alive & (new_x == self.food[:, 0]) & (new_y == self.food[:, 1])
+        moved = alive & ~ate
+        np.subtract(self.body, 1, out=self.body, where=(self.body > 0) & moved[:, None, None])
+        self.lengths[ate] += 1
+        self.body[envs[alive], new_y[alive], new_x[alive]] = self.lengths[alive]
+        self.heads[alive, 0] = new_x[alive]
+        self.heads[alive, 1] = new_y[alive]
+        self.scores[ate] += 1
+        self._place_food(envs[ate])
+
+        rewards = np.zeros(self.n_envs, dtype=np.int64)
+        rewards[ate] = 10
+        rewards[dones] = -10
+        scores = self.scores.copy()
+
+        # 4. finished boards start again straight away
+        self.reset(envs[dones])
+        return rewards, dones, scores
+
+
+if __name__ == '__main__':
+    import time
+
+    n = 1000
+    env = VecSnakeEnv(n, seed=0)
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for _ in range(200):
+        env.step(rng.integers(0, 3, size=n))
+    elapsed = time.perf_counter() - start
+    print('Transitions/sec', round(200 * n / elapsed))